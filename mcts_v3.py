@@ -5,79 +5,156 @@ import math as np
 import time
 import argparse
 import json
+import sys
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import base64
+import heapq
+import struct
+import zlib
+from collections import OrderedDict
 
-from numpy.lib.function_base import piecewise
+import numpy
 
 
 MAX_BOARD = 15
 
 board = [[0 for ip in range(MAX_BOARD)] for j in range(MAX_BOARD)]
 
+# keep the searched subtree in the "data" field between turns
+TREE_REUSE = True
+# stay alive between turns and keep the board and the tree in memory, see Botzone's long-running mode
+KEEP_RUNNING = True
+# search the opponent's replies while waiting for the next request, only with KEEP_RUNNING
+PONDER = True
+# at most this many nodes go into "data", the most visited first
+TREE_DATA_NODES = 10000
+# x, y, sim_num, win_num, number of children, for each saved node in preorder,
+# win_num is a float as cut off rollouts count fractional wins
+NODE_FORMAT = struct.Struct('>BBIfH')
+# ZOBRIST[player][x][y] is xor-ed into a position's hash when player takes (x, y),
+# fixed seed so hashes agree between processes and turns
+_zobrist_random = random.Random(15)
+ZOBRIST = [
+    [[_zobrist_random.getrandbits(64) for y in range(MAX_BOARD)] for x in range(MAX_BOARD)]
+    for player in range(3)
+]
+
+
+def transform(move, k):
+    "the image of move under the k-th of the 8 symmetries of the board, k = 0 is the identity"
+    x, y = move
+    n = MAX_BOARD - 1
+    return [(x, y), (y, n - x), (n - x, n - y), (n - y, x),
+            (x, n - y), (n - x, y), (y, x), (n - y, n - x)][k]
+
+
+# transform(transform(move, k), INVERSE_SYMMETRY[k]) == move
+INVERSE_SYMMETRY = (0, 3, 2, 1, 4, 5, 6, 7)
+
+# ZOBRIST_SYMMETRY[player][x][y][k] is the key of (x, y) seen through symmetry k,
+# so the hashes of all 8 images of a position are kept at once
+ZOBRIST_SYMMETRY = [
+    [[tuple(ZOBRIST[player][tx][ty] for tx, ty in (transform((x, y), k) for k in range(8)))
+      for y in range(MAX_BOARD)] for x in range(MAX_BOARD)]
+    for player in range(3)
+]
+
+
+class MoveSet:
+    """
+    a set of moves that also keeps them in a list, so a random move is drawn in O(1),
+    removing a move swaps the last one into its slot
+    """
+    __slots__ = ('moves', 'index')
+
+    def __init__(self, moves=()):
+        self.moves = []
+        self.index = {}
+        for move in moves:
+            self.add(move)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def __contains__(self, move):
+        return move in self.index
+
+    def add(self, move):
+        if move not in self.index:
+            self.index[move] = len(self.moves)
+            self.moves.append(move)
+
+    def discard(self, move):
+        i = self.index.pop(move, None)
+        if i is None:
+            return
+        last = self.moves.pop()
+        if i < len(self.moves):
+            self.moves[i] = last
+            self.index[last] = i
+
+    def remove(self, move):
+        if move not in self.index:
+            raise KeyError(move)
+        self.discard(move)
+
+    def clear(self):
+        self.moves = []
+        self.index = {}
+
+    def choice(self):
+        return random.choice(self.moves)
 
-class Node:
 
-    def __init__(self, move, parent=None,
-                 num_child=-1, possible_moves_for_child=None, possible_moves_for_expansion=None,
-                 board_width=None, board_height=None, num_expand=None):
+class Node:
+    """
+    a tree node only keeps its move and statistics, the moves it can still expand are
+    derived from the path by MCTS.get_expansion_moves, so no node carries a copy of the move sets
+    """
+    __slots__ = ('move', 'parent', 'children', 'sim_num', 'win_num', 'player', 'opponent', 'max_num_expansion',
+                 'hash', 'proven', 'amaf_sim', 'amaf_win', 'prior')
+
+    def __init__(self, move, parent=None, num_expand=0, position_hash=None):
         self.move = move
         self.parent = parent
         self.children = []
         self.sim_num = 0
         self.win_num = 0
+        # number of moves this node may expand, children count against it
+        self.max_num_expansion = num_expand
+        # Zobrist hash of the position after move, the root takes the board's
+        self.hash = position_hash
+        # 1 if move is proven to win for player, -1 if it is proven to lose, 0 while unknown
+        self.proven = 0
+        # all-moves-as-first statistics: simulations after the parent in which player also played move, and won
+        self.amaf_sim = 0
+        self.amaf_win = 0.0
+        # the probability the prior of MCTS gives move among its siblings, None until PUCT selection needs it
+        self.prior = None
         if parent is None:
-            self.max_num_child = num_child
-            self.max_num_expansion = num_expand
-            self.board_width = board_width
-            self.board_height = board_height
-            # inherit the possible moves for this node's children, similar to board.availables
-            # so not used yet
-            self.possible_moves_for_child = copy.deepcopy(possible_moves_for_child)
-
-            self.possible_moves_for_expansion = copy.deepcopy(possible_moves_for_expansion)
             self.player = 1
             self.opponent = 2
         if parent is not None:
-            if parent.max_num_child > 0:
-                self.max_num_child = parent.max_num_child - 1
-            # avoid expanding a move twice
-            parent.possible_moves_for_expansion.remove(move)
-
-            # independently inherit
-            self.possible_moves_for_child = copy.deepcopy(parent.possible_moves_for_child)
-            self.possible_moves_for_child.remove(move)
-            # update the neighbor information
-            self.possible_moves_for_expansion = copy.deepcopy(parent.possible_moves_for_expansion)
-            self.board_width = parent.board_width
-            self.board_height = parent.board_height
-            x, y = move
-            up, down, left, right = x, self.board_height - 1 - x, y, self.board_width - 1 - y
-            if up:
-                self.possible_moves_for_expansion.add((x - 1, y))
-                if left:
-                    self.possible_moves_for_expansion.add((x - 1, y - 1))
-                if right:
-                    self.possible_moves_for_expansion.add((x - 1, y + 1))
-            if down:
-                self.possible_moves_for_expansion.add((x + 1, y))
-                if left:
-                    self.possible_moves_for_expansion.add((x + 1, y - 1))
-                if right:
-                    self.possible_moves_for_expansion.add((x + 1, y + 1))
-            if left:
-                self.possible_moves_for_expansion.add((x, y - 1))
-            if right:
-                self.possible_moves_for_expansion.add((x, y + 1))
-            self.possible_moves_for_expansion = self.possible_moves_for_expansion & self.possible_moves_for_child
-            self.max_num_expansion = len(self.possible_moves_for_expansion)
             self.opponent = parent.player
             self.player = parent.opponent
+            if position_hash is None:
+                self.hash = parent.hash ^ ZOBRIST[self.player][move[0]][move[1]]
             parent.children.append(self)
 
 
-
 class Board:
+    # a free cell is a neighbor, i.e. a candidate move, while any stone is at one of these offsets
+    NEIGHBOR_OFFSETS = (
+        (-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1),
+        (-2, -2), (-2, 0), (-2, 2), (0, -2), (0, 2), (2, -2), (2, 0), (2, 2),
+    )
 
-    def __init__(self, input_board, n_in_line=5):
+    def __init__(self, input_board, n_in_line=5, symmetric=False):
         assert type(n_in_line) == int, "n_in_line para should be INT!"
         self.width = MAX_BOARD
         self.height = MAX_BOARD
@@ -86,92 +163,171 @@ class Board:
         self.availables = set([
             (i, j) for i in range(self.height) for j in range(self.width) if input_board[i][j] == 0
         ])
+        # counts[x][y] is the number of stones having (x, y) in their neighborhood,
+        # update and undo keep it and the neighbors set in step
+        self.around = [[self.get_around(i, j) for j in range(self.width)] for i in range(self.height)]
+        self.counts = [[0 for j in range(self.width)] for i in range(self.height)]
+        for i in range(self.height):
+            for j in range(self.width):
+                if self.board[i][j]:
+                    for x, y in self.around[i][j]:
+                        self.counts[x][y] += 1
         self.neighbors = self.getNeighbors()
+        # Zobrist hash of the stones, kept by update and undo
+        self.hash = 0
+        for i in range(self.height):
+            for j in range(self.width):
+                self.hash ^= ZOBRIST[self.board[i][j]][i][j] if self.board[i][j] else 0
+        # with symmetric, the hashes of the 8 symmetric images are kept as well, see canonical_hash
+        self.symmetric = symmetric
+        self.symmetry_hashes = [0] * 8
+        if symmetric:
+            for i in range(self.height):
+                for j in range(self.width):
+                    if self.board[i][j]:
+                        self.flip_symmetry_hashes(self.board[i][j], i, j)
+        # codes[(x * width + y) * 4 + d] has the stones at LINE_STEPS from (x, y) along LINE_DIRECTIONS[d],
+        # 2 bits per step, 3 off the board, checkStatus reads them for either player through LINE_VIEW.
+        # Only the codes on the lines of a move change with it, they follow the first codes_depth moves
+        # of history and sync_codes catches up when they are read, so rollouts not scoring moves pay nothing
+        self.codes = list(LINE_BASE)
+        # weights[x * width + y] sums ROLLOUT_WEIGHTS over the four codes of (x, y), None until track_weights
+        self.weights = None
+        for i in range(self.height):
+            for j in range(self.width):
+                if self.board[i][j]:
+                    self.mark_lines(self.board[i][j], i, j)
+        self.codes_depth = 0
+        # stack of the moves played by update(), used by undo()
+        self.history = []
 
     def is_free(self, x, y):
         return 1 if self.board[x][y] == 0 else 0
 
+    def get_around(self, x, y):
+        return [
+            (x + dx, y + dy) for dx, dy in self.NEIGHBOR_OFFSETS
+            if 0 <= x + dx < self.height and 0 <= y + dy < self.width
+        ]
+
     def getNeighbors(self):
-        neighbors = set()
         if len(self.availables) == self.width * self.height:
             "if the board is empty, then choose from the center one"
             "assume our board is bigger than 1x1"
             x0, y0 = self.width // 2 - 1, self.height // 2 - 1
-            neighbors.add((x0, y0))
-            return neighbors
-        else:
-            for i in range(self.height):
-                for j in range(self.width):
-                    if self.board[i][j]:
-                        neighbors.add((i - 1, j - 1))
-                        neighbors.add((i - 1, j))
-                        neighbors.add((i - 1, j + 1))
-                        neighbors.add((i, j - 1))
-                        neighbors.add((i, j + 1))
-                        neighbors.add((i + 1, j - 1))
-                        neighbors.add((i + 1, j))
-                        neighbors.add((i + 1, j + 1))
-
-                        neighbors.add((i - 2, j - 2))
-                        neighbors.add((i - 2, j))
-                        neighbors.add((i - 2, j + 2))
-                        neighbors.add((i, j - 2))
-                        neighbors.add((i, j + 2))
-                        neighbors.add((i + 2, j - 2))
-                        neighbors.add((i + 2, j))
-                        neighbors.add((i + 2, j + 2))
-
-            neighbors = neighbors & self.availables
-            return neighbors
-
-    def update(self, player, move, update_neighbor=True):
-        """
-        update the board and check if player wins, so one should use like this:
-            if board.update(player, move):
+            return MoveSet([(x0, y0)])
+        return MoveSet([move for move in self.availables if self.counts[move[0]][move[1]]])
+
+    def update(self, player, move):
+        """
+        update the board, the neighbors follow incrementally through the reference counts
         :param player: the one to take the move
         :param move: a tuple (x, y)
-        :param update_neighbor: built for periods when you are sure no one wins
-        :return: 1 denotes player wins and 0 denotes not
         """
         assert len(move) == 2, "move is invalid, length = {}".format(len(move))
-        self.board[move[0]][move[1]] = player
+        x, y = move
+        if len(self.availables) == self.width * self.height:
+            # drop the center cell given to the empty board
+            self.neighbors.clear()
+        self.board[x][y] = player
+        self.hash ^= ZOBRIST[player][x][y]
+        if self.symmetric:
+            self.flip_symmetry_hashes(player, x, y)
         self.availables.remove(move)
+        self.neighbors.discard(move)
+        for i, j in self.around[x][y]:
+            self.counts[i][j] += 1
+            if self.counts[i][j] == 1 and self.board[i][j] == 0:
+                self.neighbors.add((i, j))
+        self.history.append(move)
+
+    def undo(self):
+        """
+        take back the last update, so one working board can be replayed forward and then rewound:
+            board.update(player, move)
+            ...
+            board.undo()
+        """
+        move = self.history.pop()
+        x, y = move
+        self.hash ^= ZOBRIST[self.board[x][y]][x][y]
+        if self.symmetric:
+            self.flip_symmetry_hashes(self.board[x][y], x, y)
+        if self.codes_depth > len(self.history):
+            self.codes_depth -= 1
+            self.unmark_lines(self.board[x][y], x, y)
+        self.board[x][y] = 0
+        self.availables.add(move)
+        for i, j in self.around[x][y]:
+            self.counts[i][j] -= 1
+            if self.counts[i][j] == 0 and self.board[i][j] == 0:
+                self.neighbors.discard((i, j))
+        if self.counts[x][y]:
+            self.neighbors.add(move)
+        elif len(self.availables) == self.width * self.height:
+            self.neighbors = self.getNeighbors()
+
+    def mark_lines(self, player, x, y):
+        "add a stone of player at (x, y) to the line codes of the cells around"
+        codes = self.codes
+        weights = self.weights
+        if weights is None:
+            for index, stone in LINE_IMPACT[player][x][y]:
+                codes[index] += stone
+            return
+        for index, stone in LINE_IMPACT[player][x][y]:
+            old = codes[index]
+            codes[index] = old + stone
+            weights[index >> 2] += ROLLOUT_WEIGHTS[old + stone] - ROLLOUT_WEIGHTS[old]
+
+    def track_weights(self):
+        "keep the rollout weights of the cells from now on, mark_lines updates them with the codes"
+        self.sync_codes()
+        self.weights = [sum(ROLLOUT_WEIGHTS[stones] for stones in self.codes[i * 4:i * 4 + 4])
+                        for i in range(self.width * self.height)]
+
+    def sync_codes(self):
+        "bring the line codes up to the last move of history"
+        while self.codes_depth < len(self.history):
+            x, y = self.history[self.codes_depth]
+            self.mark_lines(self.board[x][y], x, y)
+            self.codes_depth += 1
+
+    def unmark_lines(self, player, x, y):
+        "take a stone of player at (x, y) back from the line codes of the cells around"
+        codes = self.codes
+        weights = self.weights
+        if weights is None:
+            for index, stone in LINE_IMPACT[player][x][y]:
+                codes[index] -= stone
+            return
+        for index, stone in LINE_IMPACT[player][x][y]:
+            old = codes[index]
+            codes[index] = old - stone
+            weights[index >> 2] += ROLLOUT_WEIGHTS[old - stone] - ROLLOUT_WEIGHTS[old]
 
-        if update_neighbor:
-            self.neighbors.remove(move)
+    def flip_symmetry_hashes(self, player, x, y):
+        keys = ZOBRIST_SYMMETRY[player][x][y]
+        for k in range(8):
+            self.symmetry_hashes[k] ^= keys[k]
 
-            neighbors = set()
-            x, y = move
-            up, down, left, right = x, self.height - 1 - x, y, self.width - 1 - y
-            if up:
-                neighbors.add((x - 2, y))
-                neighbors.add((x - 1, y))                
-                if left:
-                    neighbors.add((x - 1, y - 1))
-                    neighbors.add((x - 2, y - 2))
-                if right:
-                    neighbors.add((x - 1, y + 1))
-                    neighbors.add((x - 2, y + 2))
-            if down:
-                neighbors.add((x + 2, y))
-                neighbors.add((x + 1, y))
-
-                if left:
-                    neighbors.add((x + 1, y - 1))
-                    neighbors.add((x + 2, y - 2))
-                if right:
-                    neighbors.add((x + 1, y + 1))
-                    neighbors.add((x + 2, y + 2))
-            if left:
-                neighbors.add((x, y - 2))
-                neighbors.add((x, y - 1))
-            if right:
-                neighbors.add((x, y + 1))
-                neighbors.add((x, y + 2))
-            neighbors = self.availables & neighbors
-            self.neighbors = self.neighbors | neighbors
-
-    def getValue(self, length, open):
+    def canonical_hash(self):
+        """
+        the same hash for all 8 rotations and reflections of the position, the smallest of their hashes.
+        With k = self.symmetry_hashes.index(self.canonical_hash()), a move here is transform(move, k)
+        in the canonical position and a move kept for the canonical position, e.g. by a book or a cache,
+        is transform(move, INVERSE_SYMMETRY[k]) here
+        """
+        assert self.symmetric, "build the board with symmetric=True"
+        return min(self.symmetry_hashes)
+
+    def rewind(self, depth):
+        """undo moves until only the first depth moves of history are left"""
+        while len(self.history) > depth:
+            self.undo()
+
+    @staticmethod
+    def getValue(length, open):
         if (length >= 5):
             return 2000
         
@@ -192,286 +348,44 @@ class Board:
         if (length == 1 and open == 1):
             return 1
         return 0
-    
-    def checkStatus(self, player, move) :
-        self.board[move[0]][move[1]] = player
-        x_this, y_this = move
-        """x++, x--"""
-        length = -1
-        maxV = 0
-        open = 0
-        count = 0
-        x_save = x_this
-        y_save = y_this
-        while (x_this >= 0 and self.board[x_this][y_this] == player):
-            x_this -= 1
-            length += 1
-
-        if(x_this >= 0 and self.board[x_this][y_this] == 0):
-            open += 1
-
-        x_this = x_save
-
-        while (x_this < self.height and self.board[x_this][y_this] == player):
-            x_this += 1
-            length += 1
-        
-        if (x_this < self.height and self.board[x_this][y_this] == 0):
-            open += 1
-        v = self.getValue(length, open)
-        if(v > 1000):
-            self.board[move[0]][move[1]] = 0
-            return v
-        if(v > 500): 
-            count += 1
-        if(maxV < v):
-            maxV = v
-
-
-        """y++, y--"""
-        length = -1
-        open = 0
-        x_this = x_save
-        y_this = y_save
-        while (y_this >= 0 and self.board[x_this][y_this] == player):
-            y_this -= 1
-            length += 1
-
-        if(y_this >= 0 and self.board[x_this][y_this] == 0):
-            open += 1
-
-        y_this = y_save
-
-        while (y_this < self.width and self.board[x_this][y_this] == player):
-            y_this += 1
-            length += 1
-        
-        if (y_this < self.width and self.board[x_this][y_this] == 0):
-            open += 1
-        v = self.getValue(length, open)
-        if(v > 1000):
-            self.board[move[0]][move[1]] = 0
-            return v
-        if(v > 500): 
-            count += 1
-        if(maxV < v):
-            maxV = v
-
-
-        """x++, y++"""
-        x_this = x_save
-        y_this = y_save
-        length = -1
-        open = 0
-        while (x_this < self.height and  y_this < self.width and self.board[x_this][y_this] == player):
-            y_this += 1
-            x_this += 1
-            length += 1
-
-        if(x_this <self.height and y_this < self.width and self.board[x_this][y_this] == 0):
-            open += 1
-
-        y_this = y_save
-        x_this = x_save
-        while (x_this >= 0 and y_this >= 0 and self.board[x_this][y_this] == player):
-            y_this -= 1
-            x_this -= 1
-            length += 1
-        
-        if (x_this >= 0 and y_this >= 0 and self.board[x_this][y_this] == 0):
-            open += 1
-        v = self.getValue(length, open)
-        if(v > 1000):
-            self.board[move[0]][move[1]] = 0
-            return v
-        if(v > 500): 
-            count += 1
-        if(maxV < v):
-            maxV = v
-
-
-        """x++, y--"""
-        y_this = y_save
-        x_this = x_save
-        length = -1
-        open = 0
-        while (x_this < self.height and  y_this >= 0 and self.board[x_this][y_this] == player):
-            y_this -= 1
-            x_this += 1
-            length += 1
-
-        if(x_this < self.height and y_this >= 0 and self.board[x_this][y_this] == 0):
-            open += 1
-
-        y_this = y_save
-        x_this = x_save
-
-        while (x_this >= 0 and y_this < self.width and self.board[x_this][y_this] == player):
-            y_this += 1
-            x_this -= 1
-            length += 1
-        
-        if (y_this < self.width and x_this >= 0  and self.board[x_this][y_this] == 0):
-            open += 1
-        v = self.getValue(length, open)
-        if(v > 1000):
-            self.board[move[0]][move[1]] = 0
-            return v
-        if(v > 500): 
-            count += 1
-        if(maxV < v):
-            maxV = v
-
-
-        y_this = y_save
-        x_this = x_save
-
-        if(x_this - 4 > 0 and x_this + 1 < self.height and self.board[x_this - 1][y_this] == 0 and self.board[x_this - 2][y_this] == player and 
-            self.board[x_this - 3][y_this] == player and self.board[x_this - 4][y_this] == 0 and 
-            self.board[x_this + 1][y_this] == 0):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(y_this - 4 > 0 and y_this + 1 < self.width and self.board[x_this][y_this - 1] == 0 and self.board[x_this][y_this - 2] == player and 
-            self.board[x_this][y_this - 3] == player and self.board[x_this][y_this - 4] == 0 and 
-            self.board[x_this][y_this + 1] == 0):
-            v = 450 
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-
-        if(x_this + 4 < self.height and x_this - 1 > 0 and self.board[x_this + 1][y_this] == 0 and self.board[x_this + 2][y_this] == player and 
-            self.board[x_this + 3][y_this] == player and self.board[x_this + 4][y_this] == 0 and 
-            self.board[x_this - 1][y_this] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(y_this + 4 < self.height and y_this -1 > 0 and self.board[x_this][y_this + 1] == 0 and self.board[x_this][y_this + 2] == player and 
-            self.board[x_this][y_this + 3] == player and self.board[x_this][y_this + 4] == 0 and 
-            self.board[x_this][y_this - 1] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-
-        if(x_this - 2 > 0 and x_this + 3 < self.height and self.board[x_this - 1][y_this] == player and self.board[x_this - 2][y_this] == 0 and 
-            self.board[x_this + 1][y_this] == 0 and self.board[x_this + 2][y_this] == player and
-            self.board[x_this + 3][y_this] == 0 ):
-            v = 450
-            
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(y_this - 2 > 0 and y_this + 3 < self.width and self.board[x_this][y_this - 1] == player and self.board[x_this][y_this - 2] == 0 and 
-            self.board[x_this][y_this + 1] == 0 and self.board[x_this][y_this + 2] == player and
-            self.board[x_this][y_this + 3] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(x_this + 2 < self.height and x_this - 3 > 0 and self.board[x_this + 1][y_this] == player and self.board[x_this + 2][y_this] == 0 
-            and self.board[x_this - 1][y_this] == 0 and self.board[x_this - 2][y_this] == player and
-            self.board[x_this - 3][y_this] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
 
-        if(y_this - 3 > 0 and y_this + 2 < self.width and self.board[x_this][y_this + 1] == player and self.board[x_this][y_this + 2] == 0 
-            and self.board[x_this][y_this - 1] == 0 and self.board[x_this][y_this - 2] == player and
-            self.board[x_this][y_this - 3] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-
-
-        if(x_this - 4 > 0 and y_this - 4 > 0 and x_this + 1 < self.height and y_this + 1 < self.width and
-             self.board[x_this - 1][y_this - 1] == 0 and self.board[x_this - 2][y_this - 2] == player and 
-            self.board[x_this - 3][y_this - 3] == player and self.board[x_this - 4][y_this - 4] == 0 and 
-            self.board[x_this + 1][y_this + 1] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(x_this - 1 > 0 and y_this - 4 > 0 and x_this + 4 < self.height and y_this + 1 < self.width and
-            self.board[x_this + 1][y_this - 1] == 0 and self.board[x_this + 2][y_this - 2] == player and 
-            self.board[x_this + 3][y_this - 3] == player and self.board[x_this + 4][y_this - 4] == 0 and 
-            self.board[x_this - 1][y_this + 1] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(x_this - 1 > 0 and y_this - 1 > 0 and x_this + 4 < self.height and y_this + 4 < self.width and
-            self.board[x_this + 1][y_this + 1] == 0 and self.board[x_this + 2][y_this + 2] == player and 
-            self.board[x_this + 3][y_this + 3] == player and self.board[x_this + 4][y_this + 4] == 0 and 
-            self.board[x_this - 1][y_this - 1] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
+    def line_codes(self, player, move):
+        "the line codes of move along LINE_DIRECTIONS seen by player, see checkStatus"
+        self.sync_codes()
+        view = LINE_VIEW[player]
+        index = (move[0] * self.width + move[1]) * 4
+        return [view[stones & 255] + 81 * view[stones >> 8] for stones in self.codes[index:index + 4]]
 
-        if(x_this - 4 > 0 and y_this - 1 > 0 and x_this + 1 < self.height and y_this + 4 < self.width and
-            self.board[x_this - 1][y_this + 1] == 0 and self.board[x_this - 2][y_this + 2] == player and 
-            self.board[x_this - 3][y_this + 3] == player and  self.board[x_this - 4][y_this + 4] == 0 and
-            self.board[x_this + 1][y_this - 1] == 0 ):
-            v = 450
-            count += 1   
-            if(maxV < v):
-                maxV = v
-
-
-        if(x_this + 2 < self.height and y_this + 2 < self.width and x_this - 3 > 0 and y_this - 3 > 0 and
-            self.board[x_this - 1][y_this - 1] == 0 and self.board[x_this - 2][y_this - 2] == player and 
-            self.board[x_this + 1][y_this + 1] == player and self.board[x_this - 3][y_this - 3] == 0 and
-            self.board[x_this + 2][y_this + 2] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(x_this + 3 < self.height and y_this + 3 < self.width and x_this - 2 > 0 and y_this - 2 > 0 and
-            self.board[x_this + 1][y_this + 1] == 0 and self.board[x_this + 2][y_this + 2] == player and 
-            self.board[x_this - 1][y_this - 1] == player and self.board[x_this + 3][y_this + 3] == 0 and
-            self.board[x_this - 2][y_this - 2] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(x_this + 3 < self.height and y_this + 2 < self.width and x_this - 2 > 0 and y_this - 3 > 0 and
-            self.board[x_this + 1][y_this - 1] == 0 and self.board[x_this + 2][y_this - 2] == player
-            and self.board[x_this - 1][y_this + 1] == player and self.board[x_this + 3][y_this - 3] == 0 and
-            self.board[x_this - 2][y_this + 2] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
-                maxV = v
-
-        if(x_this + 2 < self.height and y_this + 3 < self.width and x_this - 3 > 0 and y_this - 2 > 0 and
-            self.board[x_this - 1][y_this + 1] == 0 and self.board[x_this + 2][y_this - 2] == player 
-            and self.board[x_this + 1][y_this - 1] == player and self.board[x_this - 3][y_this + 3] == 0 and
-            self.board[x_this + 2][y_this - 2] == 0 ):
-            v = 450
-            count += 1
-            if(maxV < v):
+    def checkStatus(self, player, move):
+        """
+        the value of player taking move: per direction, the run through move is scored by LINE_VALUES
+        and the broken threes (_xx_m_, _x_m_x_ and their mirrors) it makes are counted by BROKEN_THREES,
+        both indexed by the line code of self.codes seen by player, so nothing is walked here
+        """
+        x, y = move
+        self.sync_codes()
+        codes = self.codes
+        view = LINE_VIEW[player]
+        index = (x * self.width + y) * 4
+        bounds = BROKEN_BOUNDS[x][y]
+        count = 0
+        maxV = 0
+        for d in range(4):
+            stones = codes[index + d]
+            code = view[stones & 255] + 81 * view[stones >> 8]
+            v = LINE_VALUES[code]
+            if (v > 1000):
+                return v
+            if (v > 500):
+                count += 1
+            if (maxV < v):
                 maxV = v
-
-
-
-        self.board[move[0]][move[1]] = 0
-        if(count >= 2):
+            broken = BROKEN_THREES[code * 16 + bounds[d]]
+            if broken:
+                count += broken
+                if (maxV < 450):
+                    maxV = 450
+        if (count >= 2):
             return 1200
         return maxV
 
@@ -530,21 +444,450 @@ class Board:
         return 0
 
 
+# the directions checkStatus scores, in its order: along x, along y, the x = y and the x = -y diagonal
+LINE_DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+# a line code has one base 3 digit per step along the direction, the i-th of weight 3 ** i,
+# 0 for a free cell, 1 for the player's stone, 2 for the opponent's or off the board
+LINE_STEPS = (-4, -3, -2, -1, 1, 2, 3, 4)
+# LINE_VIEW[player][byte] is the line code of the 4 steps packed in byte by Board.codes, seen by player
+LINE_VIEW = [None] + [
+    [sum((0, 1, 2, 2)[byte >> 2 * i & 3] * 3 ** i for i in range(4)) for byte in range(256)],
+    [sum((0, 2, 1, 2)[byte >> 2 * i & 3] * 3 ** i for i in range(4)) for byte in range(256)],
+]
+# (step, stone) of the broken threes, 0 free and 1 own: _xx_m_, m_xx_ mirrored, x_m_x_ and _x_m_x
+BROKEN_THREE_SHAPES = (
+    ((-1, 0), (-2, 1), (-3, 1), (-4, 0), (1, 0)),
+    ((1, 0), (2, 1), (3, 1), (4, 0), (-1, 0)),
+    ((-1, 1), (-2, 0), (1, 0), (2, 1), (3, 0)),
+    ((1, 1), (2, 0), (-1, 0), (-2, 1), (-3, 0)),
+)
+
+
+def build_line_cells():
+    """
+    LINE_BASE has the Board.codes of the empty board, i.e. the 3s of the steps off the board.
+    LINE_IMPACT[player][x][y] has (index, stone) for each code a stone of player at (x, y) shows in,
+    stone is to be added to Board.codes[index].
+    BROKEN_BOUNDS[x][y][d] has bit k set if the k-th broken three fits at (x, y) along direction d
+    """
+    line_base = [0] * (MAX_BOARD * MAX_BOARD * 4)
+    line_impact = [None] + [[[[] for y in range(MAX_BOARD)] for x in range(MAX_BOARD)] for player in (1, 2)]
+    broken_bounds = [[[] for y in range(MAX_BOARD)] for x in range(MAX_BOARD)]
+    for x in range(MAX_BOARD):
+        for y in range(MAX_BOARD):
+            for d, (dx, dy) in enumerate(LINE_DIRECTIONS):
+                index = (x * MAX_BOARD + y) * 4 + d
+                for i, step in enumerate(LINE_STEPS):
+                    cx, cy = x + step * dx, y + step * dy
+                    if 0 <= cx < MAX_BOARD and 0 <= cy < MAX_BOARD:
+                        for player in (1, 2):
+                            line_impact[player][cx][cy].append((index, player << 2 * i))
+                    else:
+                        line_base[index] += 3 << 2 * i
+                bounds = 0
+                for k, shape in enumerate(BROKEN_THREE_SHAPES):
+                    # as checkStatus always had it, a shape may not reach row or column 0 along the direction
+                    # and _x_m_x never counts along the x = -y diagonal
+                    steps = [step for step, stone in shape]
+                    if all(0 < c + step * dc < MAX_BOARD for c, dc in ((x, dx), (y, dy)) if dc
+                           for step in (min(steps), max(steps))) and not (d == 3 and k == 3):
+                        bounds |= 1 << k
+                broken_bounds[x][y].append(bounds)
+    line_impact = [None] + [[[tuple(impact) for impact in row] for row in line_impact[player]] for player in (1, 2)]
+    return line_base, line_impact, broken_bounds
+
+
+def build_line_tables():
+    """
+    LINE_VALUES[code] is Board.getValue of the run through the move, BROKEN_THREES[code * 16 + bounds]
+    the number of broken threes among the shapes allowed by bounds, see BROKEN_BOUNDS
+    """
+    line_values = []
+    broken_threes = []
+    for code in range(3 ** len(LINE_STEPS)):
+        digits = {}
+        for step in LINE_STEPS:
+            digits[step] = code % 3
+            code //= 3
+        length = 1
+        open = 0
+        for sign in (-1, 1):
+            step = sign
+            while abs(step) <= 4 and digits[step] == 1:
+                length += 1
+                step += sign
+            # a run reaching the end of the code is five already, open or not
+            if abs(step) <= 4 and digits[step] == 0:
+                open += 1
+        line_values.append(Board.getValue(length, open))
+        matches = [k for k, shape in enumerate(BROKEN_THREE_SHAPES)
+                   if all(digits[step] == stone for step, stone in shape)]
+        if not matches:
+            broken_threes.extend([0] * 16)
+            continue
+        for bounds in range(16):
+            broken_threes.append(sum(1 for k in matches if bounds >> k & 1))
+    return line_values, broken_threes
+
+
+LINE_BASE, LINE_IMPACT, BROKEN_BOUNDS = build_line_cells()
+LINE_VALUES, BROKEN_THREES = build_line_tables()
+LINE_VALUES_ARRAY = numpy.array(LINE_VALUES, dtype=numpy.int32)
+BROKEN_THREES_ARRAY = numpy.array(BROKEN_THREES, dtype=numpy.int32)
+BROKEN_BOUNDS_ARRAY = numpy.array(BROKEN_BOUNDS, dtype=numpy.int32)
+
+
+def build_threat_tables():
+    """
+    FIVE_STEPS[code] has the free steps of a line code that make five together with the move,
+    so a move makes a four along the line if there is one and an open four if there are two.
+    OPEN_FOUR_STEPS[code] has the free steps that make an open four together with the move,
+    so the move makes a three the defender has to answer on this line
+    """
+    def five_steps(digits):
+        steps = []
+        for step in LINE_STEPS:
+            if digits[step] == 0:
+                digits[step] = 1
+                length = 1
+                for sign in (-1, 1):
+                    s = sign
+                    while abs(s) <= 4 and digits[s] == 1:
+                        length += 1
+                        s += sign
+                digits[step] = 0
+                if length >= 5:
+                    steps.append(step)
+        return tuple(steps)
+
+    five = []
+    open_four = []
+    for code in range(3 ** len(LINE_STEPS)):
+        digits = {}
+        for step in LINE_STEPS:
+            digits[step] = code % 3
+            code //= 3
+        five.append(five_steps(digits))
+        steps = []
+        # a run of 5 with the move needs 3 more stones within a window, skip the lines without 2 yet
+        if sum(1 for step in LINE_STEPS if digits[step] == 1) >= 2:
+            for step in LINE_STEPS:
+                if digits[step] == 0:
+                    digits[step] = 1
+                    if len(five_steps(digits)) >= 2:
+                        steps.append(step)
+                    digits[step] = 0
+        open_four.append(tuple(steps))
+    return five, open_four
+
+
+FIVE_STEPS, OPEN_FOUR_STEPS = build_threat_tables()
+
+
+def build_five_codes(player):
+    "FIVE_CODES[player][stones] is 1 if player makes five at a cell with Board.codes stones along a direction"
+    stones = numpy.arange(1 << 16)
+    view = numpy.array(LINE_VIEW[player])
+    codes = view[stones & 255] + 81 * view[stones >> 8]
+    return bytes((LINE_VALUES_ARRAY[codes] >= 2000).astype(numpy.uint8))
+
+
+FIVE_CODES = [None, build_five_codes(1), build_five_codes(2)]
+
+# the rollout policy's weight of a move for its player by the LINE_VALUES of one direction,
+# a five is flagged apart: open four, four or open three, closed three, two
+ROLLOUT_VALUE_WEIGHTS = ((1600, 32), (600, 16), (50, 4), (4, 1))
+# fields of a packed rollout weight, summed over the four directions of a cell without overflowing:
+# ROLLOUT_FIVE[player] counts the directions where player makes five, ROLLOUT_SHIFT[player] starts player's weight
+ROLLOUT_FIVE = (None, 0xf, 0xf0)
+ROLLOUT_SHIFT = (None, 8, 20)
+
+
+def build_rollout_weights():
+    """
+    ROLLOUT_WEIGHTS[stones] packs, for a cell with Board.codes stones along a direction, whether each player
+    makes five there and each player's weight, so Board.weights adds them up per cell
+    """
+    stones = numpy.arange(1 << 16)
+    packed = numpy.zeros(1 << 16, dtype=numpy.int64)
+    for player in (1, 2):
+        view = numpy.array(LINE_VIEW[player])
+        values = LINE_VALUES_ARRAY[view[stones & 255] + 81 * view[stones >> 8]]
+        weight = numpy.zeros(1 << 16, dtype=numpy.int64)
+        for value, w in reversed(ROLLOUT_VALUE_WEIGHTS):
+            weight[values >= value] = w
+        weight[values >= 2000] = 0
+        packed += (values >= 2000) << (4 * (player - 1))
+        packed += weight << ROLLOUT_SHIFT[player]
+    return packed.tolist()
+
+
+ROLLOUT_WEIGHTS = build_rollout_weights()
+# MCTS.evaluate's logistic of the summed pattern weights, fitted to how pattern rollouts cut off here end
+EVALUATION_TEMPO = 1.2
+EVALUATION_SCALE = 96.0
+EVALUATION_BIAS = 0.07
+
+
+def line_codes(boards, player):
+    """
+    the line codes of checkStatus for every cell of boards, a (B, 15, 15) array, seen by player
+    :return: a (B, 15, 15, 4) array, the last axis along LINE_DIRECTIONS
+    """
+    n = max(LINE_STEPS)
+    # the border of 3s is off the board, a digit 2 for both players
+    padded = numpy.pad(boards, ((0, 0), (n, n), (n, n)), constant_values=3)
+    digits = numpy.where(padded == 0, 0, numpy.where(padded == player, 1, 2)).astype(numpy.int32)
+    codes = numpy.zeros(boards.shape + (4,), dtype=numpy.int32)
+    for d, (dx, dy) in enumerate(LINE_DIRECTIONS):
+        for i, step in enumerate(LINE_STEPS):
+            x, y = n + step * dx, n + step * dy
+            codes[..., d] += digits[:, x:x + MAX_BOARD, y:y + MAX_BOARD] * 3 ** i
+    return codes
+
+
+def board_status(boards, player):
+    "Board.checkStatus(player, move) for every cell of boards, a (B, 15, 15) array, at once"
+    codes = line_codes(boards, player)
+    values = LINE_VALUES_ARRAY[codes]
+    broken = BROKEN_THREES_ARRAY[codes * 16 + BROKEN_BOUNDS_ARRAY]
+    # checkStatus returns the value of the first direction above 1000 as it is
+    big = values > 1000
+    first = numpy.take_along_axis(values, big.argmax(axis=-1)[..., None], axis=-1)[..., 0]
+    count = (values > 500).sum(axis=-1) + broken.sum(axis=-1)
+    maxV = numpy.maximum(values.max(axis=-1), numpy.where(broken.any(axis=-1), 450, 0))
+    status = numpy.where(count >= 2, 1200, maxV)
+    return numpy.where(big.any(axis=-1), first, status)
+
+
+def evaluate_boards(boards, player=2):
+    """
+    the maxVal of MCTS.get_candidates for every free cell, for a board or a batch of positions
+    :param boards: a (15, 15) or (B, 15, 15) array of 0, 1 and 2
+    :param player: the one to move in all positions
+    :return: an int array of the same shape, 0 on the stones
+    """
+    boards = numpy.asarray(boards, dtype=numpy.int8)
+    single = boards.ndim == 2
+    if single:
+        boards = boards[None]
+    scores = numpy.maximum(board_status(boards, player) + 150, board_status(boards, 3 - player))
+    scores[boards != 0] = 0
+    return scores[0] if single else scores
+
+
+def pattern_prior(board, player, moves):
+    """
+    the default prior of MCTS: the maxVal of MCTS.get_candidates for each move
+    :param board: a Board at the position of the parent node
+    :param player: the one to move
+    :param moves: the free cells to weigh
+    :return: a non-negative weight per move, MCTS normalizes them to sum to 1
+    """
+    opponent = 3 - player
+    return [max(board.checkStatus(player, move) + 150, board.checkStatus(opponent, move)) for move in moves]
+
+
+class BitBoard(Board):
+    """
+    the same board with one int per row, column and diagonal for each player,
+    so check_win finds n in line with shifts and masks instead of scanning every window
+    """
+
+    def __init__(self, input_board, n_in_line=5, symmetric=False):
+        Board.__init__(self, input_board, n_in_line, symmetric)
+        n_diagonal = self.width + self.height - 1
+        # lines[player] = [rows, columns, diagonals \, anti-diagonals /], the bit of a cell
+        # is its column in a row and its row otherwise
+        self.lines = {
+            player: [[0] * self.height, [0] * self.width, [0] * n_diagonal, [0] * n_diagonal]
+            for player in (1, 2)
+        }
+        # win_masks[bit] covers the starts of the n in line windows holding that bit
+        self.win_masks = []
+        for bit in range(max(self.width, self.height)):
+            low = max(bit - self.n_in_line + 1, 0)
+            self.win_masks.append(((1 << (bit + 1)) - 1) ^ ((1 << low) - 1))
+        for i in range(self.height):
+            for j in range(self.width):
+                if self.board[i][j]:
+                    self.flip(self.board[i][j], i, j)
+
+    def flip(self, player, x, y):
+        rows, columns, diagonals, anti_diagonals = self.lines[player]
+        rows[x] ^= 1 << y
+        columns[y] ^= 1 << x
+        diagonals[x - y + self.width - 1] ^= 1 << x
+        anti_diagonals[x + y] ^= 1 << x
+
+    def update(self, player, move):
+        Board.update(self, player, move)
+        self.flip(player, move[0], move[1])
+
+    def undo(self):
+        x, y = self.history[-1]
+        self.flip(self.board[x][y], x, y)
+        Board.undo(self)
+
+    def check_win(self, player, move):
+        """check if player win, this function will not actually do the move"""
+        x, y = move
+        rows, columns, diagonals, anti_diagonals = self.lines[player]
+        for line, bit in ((rows[x], y), (columns[y], x),
+                          (diagonals[x - y + self.width - 1], x), (anti_diagonals[x + y], x)):
+            line |= 1 << bit
+            # bit i of run is set when the n cells from i on are all taken
+            run = line
+            for shift in range(1, self.n_in_line):
+                run &= line >> shift
+            if run & self.win_masks[bit]:
+                return 1
+        return 0
+
+
 class MCTS:
 
-    def __init__(self, input_board, n_in_line=5, time_limit=5.0, max_simulation=5, max_simulation_one_play=50):
+    def __init__(self, input_board, n_in_line=5, time_limit=5.0, max_simulation=5, max_simulation_one_play=50,
+                 bitboard=False, workers=1, seed=None, tree_parallel=False, shared_nodes=200000, virtual_loss=1,
+                 tt_size=0, symmetric=False, vectorized=False, batch_rollouts=False, threat_nodes=0, threat_time=0.5,
+                 leaf_threat_nodes=0, rave_k=0, rollout_policy=False, rollout_depth=0,
+                 pw_c=0, pw_alpha=0.5, prior_cache=50000, puct_c=0, prior=None, adaptive_time=False, clock=None):
         self.time_limit = float(time_limit)
         self.max_simulation = max_simulation
         self.max_simulation_one_play = max_simulation_one_play
-        self.MCTSboard = Board(input_board, n_in_line)    
+        self.n_in_line = n_in_line
+        self.bitboard = bitboard
+        # root parallelization: workers > 1 searches that many independent trees in a process pool,
+        # worker i is seeded with seed + i
+        self.workers = workers
+        self.seed = seed
+        self.pool = None
+        # tree_parallel makes the workers share one SharedTree of shared_nodes nodes instead,
+        # each visit in progress counts as virtual_loss lost simulations
+        self.tree_parallel = tree_parallel
+        self.shared_nodes = shared_nodes
+        self.virtual_loss = virtual_loss
+        # BitBoard gives the same results with a faster check_win
+        # with symmetric, nodes are hashed by their canonical position, so the transposition table
+        # shares statistics between rotated and mirrored positions too
+        self.symmetric = symmetric
+        if bitboard:
+            self.MCTSboard = BitBoard(input_board, n_in_line, symmetric)
+        else:
+            self.MCTSboard = Board(input_board, n_in_line, symmetric)
         self.player = 2
+        self.get_player = {
+            1: 2,
+            2: 1,
+        }
+        # shares sim_num and win_num between nodes of the same position, None without one
+        self.tt = TranspositionTable(tt_size) if tt_size else None
+        # with vectorized, get_candidates scores the whole board at once with evaluate_boards
+        self.vectorized = vectorized
+        # with batch_rollouts, the max_simulation rollouts of a new node are played at once by batch_rollout,
+        # rng is its numpy generator, seeded from random so seeding random still repeats a search; the batch
+        # plays uniform moves to the end and records none, so it does not combine with rollout_policy,
+        # rollout_depth or rave_k
+        self.batch_rollouts = batch_rollouts
+        self.rng = None
+        # a ThreatSolver of threat_nodes positions and threat_time seconds looks for a forced win before
+        # each search, one of leaf_threat_nodes positions for a VCF at each new node, 0 turns them off
+        self.threat_nodes = threat_nodes
+        self.threat_time = threat_time
+        self.leaf_threat_nodes = leaf_threat_nodes
+        # RAVE: with rave_k > 0, selection blends a child's win rate with its AMAF win rate, weighted
+        # by sqrt(rave_k / (3 * sim_num + rave_k)), so the AMAF rate counts until about rave_k simulations
+        self.rave_k = rave_k
+        # with rollout_policy, rollouts play a five, else block one, else draw moves by pattern weight, see policy_move
+        self.rollout_policy = rollout_policy and n_in_line == 5
+        # with rollout_depth, rollouts stop after that many moves and count the win chance evaluate gives
+        self.rollout_depth = rollout_depth if n_in_line == 5 else 0
+        assert not (batch_rollouts and (self.rollout_policy or self.rollout_depth or rave_k)), \
+            "batch_rollouts does not combine with rollout_policy, rollout_depth or rave_k"
+        if self.rollout_policy or self.rollout_depth:
+            self.MCTSboard.track_weights()
+        # progressive widening: with pw_c > 0, a node visited n times has at most max(1, pw_c * n ** pw_alpha)
+        # children, expanded highest prior first; priors keeps the moves and priors of prior_cache
+        # positions by hash, get_candidates empties it as the moves around a path include the root candidates
+        self.pw_c = pw_c
+        self.pw_alpha = pw_alpha
+        self.prior_cache = prior_cache
+        self.priors = OrderedDict()
+        # PUCT: with puct_c > 0, selection adds puct_c * prior * sqrt(parent sim_num) / (1 + sim_num) to a child's
+        # win rate instead of the UCB1 term; prior(board, player, moves) weighs the moves, pattern_prior by default
+        self.puct_c = puct_c
+        self.prior = prior or pattern_prior
+        self.get_candidates()
+        self.root = self.new_root()
+        self.ponder_thread = None
+        self.ponder_stop = threading.Event()
+        # with adaptive_time, get_action spends less in the opening and stops early or runs longer as the root
+        # children split, see TimeManager; clock is the seconds left for the game when the platform keeps one
+        self.adaptive_time = adaptive_time
+        self.clock = clock
+
+    def new_root(self, player=1):
+        "a fresh root for the current board, player made the last move"
+        root = Node(None, parent=None, num_expand=len(self.candidates),
+                    position_hash=self.MCTSboard.canonical_hash() if self.symmetric else self.MCTSboard.hash)
+        root.player, root.opponent = player, self.get_player[player]
+        return root
+
+    def add_child(self, parent, move):
+        "a new child of parent, hashed by its canonical position with symmetric"
+        if not self.symmetric:
+            return Node(move, parent=parent)
+        return Node(move, parent=parent, position_hash=self.canonical_position_hash(parent, move)[0])
+
+    def canonical_position_hash(self, node, move=None):
+        """
+        the canonical hash of the position after node's path and then move, if any, the board being at the
+        root; it is min over the 8 symmetric hashes, each updated along the path like Board.symmetry_hashes.
+        Returns it with the symmetry k it comes from, a move of the position is transform(move, k) in the
+        canonical one, as for Board.canonical_hash
+        """
+        hashes = list(self.MCTSboard.symmetry_hashes)
+        if move is not None:
+            player = self.get_player[node.player]
+            keys = ZOBRIST_SYMMETRY[player][move[0]][move[1]]
+            for k in range(8):
+                hashes[k] ^= keys[k]
+        while node.move:
+            keys = ZOBRIST_SYMMETRY[node.player][node.move[0]][node.move[1]]
+            for k in range(8):
+                hashes[k] ^= keys[k]
+            node = node.parent
+        canonical = min(hashes)
+        return canonical, hashes.index(canonical)
+
+    def get_stats(self, node):
+        "(sim_num, win_num) of node, shared with every node of the same position through the transposition table"
+        if self.tt is not None:
+            entry = self.tt.get(node.hash)
+            if entry is not None:
+                return entry[0], entry[1]
+        return node.sim_num, node.win_num
+
+    def get_candidates(self, player=2):
+        """
+        score the neighbors of the current board and keep the moves worth searching in self.candidates;
+        the line codes are kept incrementally, but every neighbor is still scored, about 0.2-0.4 ms
+        for the 80 neighbors of a 40 stone board, so this is O(neighbors) and not O(changed cells)
+        :param player: the one to move, we are 2 and the opponent is 1 when pondering
+        """
         self.candidates = set()
         self.allmoves = dict()
         self.flag = 0
+        self.priors.clear()
+        if self.vectorized:
+            scores = evaluate_boards(self.MCTSboard.board, player)
         for move in self.MCTSboard.neighbors:
-            value1 = self.MCTSboard.checkStatus(1, move)
-            value2 = self.MCTSboard.checkStatus(2, move)
-            maxVal = max(value2 + 150, value1)
+            if self.vectorized:
+                maxVal = int(scores[move])
+            else:
+                value1 = self.MCTSboard.checkStatus(self.get_player[player], move)
+                value2 = self.MCTSboard.checkStatus(player, move)
+                maxVal = max(value2 + 150, value1)
             if(maxVal > 2000):
                 if(self.flag < 9):                 
                     self.candidates.clear()
@@ -610,108 +953,1204 @@ class MCTS:
                 if(len(self.candidates) == 0):
                     for iter in range(9):
                         self.candidates.add(orders[iter][0])
-        self.root = Node(None,
-                         parent=None,
-                         num_child=len(self.MCTSboard.availables),
-                         possible_moves_for_child=self.MCTSboard.availables,
-                         possible_moves_for_expansion=self.candidates,
-                         num_expand=len(self.candidates),
-                         board_width=self.MCTSboard.width,
-                         board_height=self.MCTSboard.height)
-        self.get_player = {
-            1: 2,
-            2: 1,
-        }
 
     def get_action(self):
+        move = self.forced_move()
+        if move is not None:
+            return move
+
+        stones = self.MCTSboard.width * self.MCTSboard.height - len(self.MCTSboard.availables)
+        # a batch plays max_simulation rollouts, so the clock is read after each one
+        timer = TimeManager(self.time_limit, stones, self.clock, self.adaptive_time,
+                            check_every=1 if self.batch_rollouts else 8)
+        move = self.threat_move()
+        if move is not None:
+            return move
+        if self.root.proven and not self.visited_children():
+            # a root a previous search proved has no winning child to play
+            move = self.proven_root_move()
+            if move is not None:
+                return move
+
+        # the parallel searches take a fixed time, so they only follow the budget
+        if self.workers > 1 and self.tree_parallel:
+            self.search_tree_parallel(timer.left())
+        elif self.workers > 1:
+            self.search_parallel(timer.left())
+        else:
+            self.search(timer=timer)
+
+        # a proven win first and a proven loss last, the win rate decides between the others
+        visited = self.visited_children()
+        if not visited:
+            return min(self.candidates)
+        proven, percent_wins, move = max(
+            (child.proven, win_num / sim_num, child.move) for child, sim_num, win_num in visited
+        )
+
+        return move
+
+    def visited_children(self):
+        "(child, sim_num, win_num) for the root children with simulations"
+        visited = []
+        for child in self.root.children:
+            sim_num, win_num = self.get_stats(child)
+            if sim_num:
+                visited.append((child, sim_num, win_num))
+        return visited
+
+    def proven_root_move(self):
+        """
+        the winning move of a root proven lost for the side that moved last without a visited child, like
+        a reply prove() marked through its VCF and advance made the root; None if the VCF is not found
+        again, the root is then unmarked and searched
+        """
+        move = None
+        if self.root.proven == -1 and self.n_in_line == 5:
+            solver = ThreatSolver(self.MCTSboard, max(self.threat_nodes, self.leaf_threat_nodes, 10000),
+                                  self.threat_time)
+            move = solver.solve(self.root.opponent, vct=False)
+        if move is None:
+            self.root.proven = 0
+        return move
+
+    def forced_move(self):
+        """
+        the move to play without searching, None if the position needs a search:
+        the last free cell, our five (flag 9), the block of the opponent's five (flag 8) or the only candidate
+        """
         if len(self.MCTSboard.availables) == 1:
-            return list(self.MCTSboard.availables)[0] 
+            return list(self.MCTSboard.availables)[0]
+        if self.flag >= 8 or len(self.candidates) == 1:
+            return min(self.candidates)
+        return None
 
+    def threat_move(self):
+        """
+        a move winning by continuous fours or threes for the side to move at the root, None if the ThreatSolver
+        finds none or is off; the root is marked proven lost for the side that moved last
+        """
+        if not self.threat_nodes or self.n_in_line != 5:
+            return None
+        solver = ThreatSolver(self.MCTSboard, self.threat_nodes, self.threat_time)
+        move = solver.solve(self.root.opponent, vct=True)
+        if move is not None:
+            self.root.proven = -1
+        return move
+
+    def prove(self, cur_board, expandNode):
+        """
+        mark expandNode proven when its move makes five or the reply has a VCF, cur_board is at its parent's
+        position; a ThreatSolver of leaf_threat_nodes positions, with leaf_threat_nodes 0 only fives count
+        """
+        if cur_board.check_win(expandNode.player, expandNode.move):
+            expandNode.proven = 1
+        elif self.leaf_threat_nodes and self.n_in_line == 5:
+            cur_board.update(expandNode.player, expandNode.move)
+            solver = ThreatSolver(cur_board, self.leaf_threat_nodes, self.threat_time)
+            if solver.solve(expandNode.opponent, vct=False) is not None:
+                expandNode.proven = -1
+            cur_board.undo()
+        return expandNode.proven
+
+    def search(self, time_limit=None, timer=None):
+        "search from the root for time_limit seconds, or as long as timer says"
+        if timer is None:
+            timer = TimeManager(time_limit, check_every=1 if self.batch_rollouts else 8)
         num_nodes = 0
-        begin_time = time.time()
-        while time.time() - begin_time < self.time_limit:
+        while not self.root.proven and not timer.expired(self.root, self.get_stats):
             node_to_expand = self.select_and_expand()
             if(node_to_expand == None):
                 continue
+            if self.batch_rollouts:
+                self.simulate_batch_and_bp(self.MCTSboard, node_to_expand, self.max_simulation)
+                num_nodes += 1
+                continue
             for _ in range(self.max_simulation):
-                board_deep_copy = copy.deepcopy(self.MCTSboard)
-                if(time.time() - begin_time > self.time_limit):
+                if(node_to_expand.proven or timer.expired(self.root, self.get_stats)):
                     break
-                self.simulate_and_bp(board_deep_copy, node_to_expand)
+                self.simulate_and_bp(self.MCTSboard, node_to_expand)
             num_nodes += 1
+        return num_nodes
 
-        percent_wins, move = max(
-            (child.win_num / child.sim_num , child.move)
-            for child in self.root.children
-        ) 
+    def search_parallel(self, time_limit):
+        """
+        root parallelization: every worker searches its own tree from the current board for time_limit,
+        then the sim_num and win_num of their root children are added to our root children
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        seed = self.seed if self.seed is not None else random.randrange(1 << 30)
+        kwargs = self.worker_kwargs()
+        jobs = [(self.MCTSboard.board, kwargs, seed + i, time_limit) for i in range(self.workers)]
+        for stats in self.pool.map(search_worker, jobs):
+            self.merge_root_stats(stats)
+
+    def worker_kwargs(self):
+        "the MCTS arguments of a worker process searching like we do, the time is the caller's"
+        return dict(n_in_line=self.n_in_line,
+                    max_simulation=self.max_simulation,
+                    max_simulation_one_play=self.max_simulation_one_play,
+                    bitboard=self.bitboard,
+                    tt_size=self.tt.capacity if self.tt is not None else 0,
+                    symmetric=self.symmetric,
+                    vectorized=self.vectorized,
+                    batch_rollouts=self.batch_rollouts,
+                    leaf_threat_nodes=self.leaf_threat_nodes,
+                    threat_time=self.threat_time,
+                    rave_k=self.rave_k,
+                    rollout_policy=self.rollout_policy,
+                    rollout_depth=self.rollout_depth,
+                    pw_c=self.pw_c,
+                    pw_alpha=self.pw_alpha,
+                    prior_cache=self.prior_cache,
+                    puct_c=self.puct_c,
+                    prior=self.prior)
+
+    def merge_root_stats(self, stats):
+        "add (move, sim_num, win_num) of root children searched elsewhere to our root children"
+        children = dict((child.move, child) for child in self.root.children)
+        for move, sim_num, win_num in stats:
+            if move not in self.candidates:
+                continue
+            if move not in children:
+                children[move] = self.add_child(self.root, move)
+            children[move].sim_num += sim_num
+            children[move].win_num += win_num
+            self.root.sim_num += sim_num
+            if self.tt is not None:
+                # get_stats reads the table first, an entry left by an earlier search would hide the merge
+                self.tt.add(children[move], win_num, sim_num)
+                self.tt.add(self.root, 0, sim_num)
+        for child in self.root.children:
+            child.max_num_expansion = len(child.children) + len(self.get_expansion_moves(child))
+        self.root.max_num_expansion = len(self.root.children) + len(self.get_expansion_moves(self.root))
+
+    def dump_tree(self, move, max_nodes=TREE_DATA_NODES):
+        """
+        pack the subtree under our move, i.e. the opponent's replies and below, into a base64 string
+        for the "data" field, keeping the max_nodes most visited nodes
+        :param move: the move we play this turn
+        :return: the string for load_tree in the next turn, None if move was not searched
+        """
+        top = None
+        for child in self.root.children:
+            if child.move == move:
+                top = child
+        if top is None:
+            return None
+        # a child is never visited more than its parent, so best-first keeps the saved part connected
+        kept = set([id(top)])
+        heap = [(-child.sim_num, id(child), child) for child in top.children]
+        heapq.heapify(heap)
+        while heap and len(kept) < max_nodes:
+            _, _, node = heapq.heappop(heap)
+            kept.add(id(node))
+            for child in node.children:
+                heapq.heappush(heap, (-child.sim_num, id(child), child))
+        chunks = []
+        stack = [top]
+        while stack:
+            node = stack.pop()
+            children = [child for child in node.children if id(child) in kept]
+            chunks.append(NODE_FORMAT.pack(node.move[0], node.move[1],
+                                           node.sim_num, node.win_num, len(children)))
+            stack.extend(reversed(children))
+        return base64.b64encode(zlib.compress(b''.join(chunks))).decode('ascii')
+
+    def load_tree(self, data, my_move, opp_move):
+        """
+        graft the subtree saved by dump_tree in the last turn under the root,
+        if it was saved for my_move and the opponent answered with one of its searched replies
+        :return: 1 if the tree is reused and 0 if not
+        """
+        try:
+            raw = zlib.decompress(base64.b64decode(data))
+        except (TypeError, ValueError, zlib.error):
+            return 0
+        try:
+            nodes = [NODE_FORMAT.unpack_from(raw, offset) for offset in range(0, len(raw), NODE_FORMAT.size)]
+        except struct.error:
+            return 0
+        if not nodes or tuple(nodes[0][:2]) != tuple(my_move):
+            return 0
+        # walk the preorder to the reply the opponent played, the subtree is the run right after it
+        i, end = 1, len(nodes)
+        for _ in range(nodes[0][4]):
+            start = i
+            pending = 1
+            while pending:
+                if i == end:
+                    # the child counts run past the records
+                    return 0
+                pending += nodes[i][4] - 1
+                i += 1
+            if tuple(nodes[start][:2]) == tuple(opp_move):
+                break
+        else:
+            return 0
+        x, y, sim_num, win_num, num_children = nodes[start]
+        self.root.sim_num, self.root.win_num = sim_num, win_num
+        stack = [(self.root, num_children)]
+        for x, y, sim_num, win_num, num_children in nodes[start + 1:i]:
+            while stack[-1][1] == 0:
+                stack.pop()
+            parent, left = stack.pop()
+            stack.append((parent, left - 1))
+            node = self.add_child(parent, (x, y))
+            node.sim_num, node.win_num = sim_num, win_num
+            stack.append((node, num_children))
+        self.refresh_tree()
+        return 1
+
+    def advance(self, my_move, opp_move):
+        """
+        play our move and the opponent's reply on the board kept between turns and
+        make the reply's node the new root, so its subtree keeps its statistics
+        """
+        self.MCTSboard.update(2, my_move)
+        self.MCTSboard.update(1, opp_move)
+        self.get_candidates()
+        new_root = None
+        for child in self.root.children:
+            if child.move == my_move:
+                for grandchild in child.children:
+                    if grandchild.move == opp_move:
+                        new_root = grandchild
+        if new_root is None:
+            self.root = self.new_root()
+            return 0
+        new_root.move = None
+        new_root.parent = None
+        self.root = new_root
+        self.refresh_tree()
+        return 1
+
+    def start_pondering(self, my_move):
+        """
+        play our move and keep searching the opponent's replies in a background thread,
+        until stop_pondering is called with the reply actually played
+        """
+        self.MCTSboard.update(2, my_move)
+        self.get_candidates(player=1)
+        new_root = None
+        for child in self.root.children:
+            if child.move == my_move:
+                new_root = child
+        if new_root is None:
+            new_root = self.new_root(player=2)
+        new_root.move = None
+        new_root.parent = None
+        self.root = new_root
+        self.refresh_tree()
+        self.ponder_stop.clear()
+        self.ponder_thread = threading.Thread(target=self.ponder)
+        self.ponder_thread.daemon = True
+        self.ponder_thread.start()
+
+    def ponder(self):
+        "the search loop of get_action, running until ponder_stop is set"
+        while not self.ponder_stop.is_set():
+            node_to_expand = self.select_and_expand()
+            if(node_to_expand == None):
+                if not self.root.children or self.root.proven:
+                    return
+                continue
+            for _ in range(self.max_simulation):
+                if self.ponder_stop.is_set() or node_to_expand.proven:
+                    break
+                self.simulate_and_bp(self.MCTSboard, node_to_expand)
 
-        return move
+    def stop_pondering(self, opp_move):
+        """
+        stop the background search, play the opponent's reply and
+        make its node the new root, so the pondered subtree is searched on
+        """
+        self.ponder_stop.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.MCTSboard.update(1, opp_move)
+        self.get_candidates()
+        new_root = None
+        for child in self.root.children:
+            if child.move == opp_move:
+                new_root = child
+        if new_root is None:
+            self.root = self.new_root()
+            return 0
+        new_root.move = None
+        new_root.parent = None
+        self.root = new_root
+        self.refresh_tree()
+        return 1
+
+    def refresh_tree(self):
+        "fit a root taken over from an earlier search to this turn's candidates and board"
+        for child in list(self.root.children):
+            if child.move not in self.candidates:
+                self.root.children.remove(child)
+                self.root.sim_num -= child.sim_num
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            node.max_num_expansion = len(node.children) + len(self.get_expansion_moves(node))
+            stack.extend(node.children)
 
     def select_and_expand(self):
         "Selection: greedy search based on UCB value"
         currentNode = self.root
         while currentNode.children:
-            if len(currentNode.children) < currentNode.max_num_expansion:
+            if len(currentNode.children) < self.allowed_children(currentNode):
                 break
 
             ucb, selectedNode = 0, None
+            parent_sim_num = max(self.get_stats(currentNode)[0], 1)
+            # the parent's part of the exploration term, once per step
+            if self.puct_c:
+                self.set_priors(currentNode)
+                explore = self.puct_c * np.sqrt(parent_sim_num)
+            else:
+                explore = 2 * np.log(parent_sim_num)
             for child in currentNode.children:
-
-                childUCB = child.win_num / child.sim_num + np.sqrt(
-                    2 * np.log(currentNode.sim_num) / child.sim_num
-                ) 
+                # a proven subtree has nothing left to search
+                if child.proven:
+                    continue
+                sim_num, win_num = self.get_stats(child)
+                if sim_num == 0:
+                    selectedNode = child
+                    break
+                value = win_num / sim_num
+                if self.rave_k and child.amaf_sim:
+                    beta = np.sqrt(self.rave_k / (3 * sim_num + self.rave_k))
+                    value = (1 - beta) * value + beta * child.amaf_win / child.amaf_sim
+                if self.puct_c:
+                    childUCB = value + explore * child.prior / (1 + sim_num)
+                else:
+                    childUCB = value + np.sqrt(explore / sim_num)
                 if childUCB >= ucb:
                     ucb, selectedNode = childUCB, child
+            if selectedNode is None:
+                # widening held back moves that may not be proven yet
+                if len(currentNode.children) < currentNode.max_num_expansion:
+                    break
+                return None
             currentNode = selectedNode
-        "Expansion: randomly expand a node"
-        if(len(list(currentNode.possible_moves_for_expansion)) == 0):
-            return None
-        expandMove = random.choice(list(currentNode.possible_moves_for_expansion))
-        expandNode = Node(expandMove, parent=currentNode)
+        "Expansion: randomly expand a node, the best scored one with progressive widening"
+        if self.pw_c:
+            expandMove = self.prior_move(currentNode)
+            if expandMove is None:
+                currentNode.max_num_expansion = len(currentNode.children)
+                return None
+        else:
+            moves = self.get_expansion_moves(currentNode)
+            if(len(moves) == 0):
+                currentNode.max_num_expansion = len(currentNode.children)
+                return None
+            expandMove = moves.choice()
+        expandNode = self.add_child(currentNode, expandMove)
+        if self.pw_c:
+            expandNode.max_num_expansion = len(self.expansion_order(expandNode))
+        else:
+            expandNode.max_num_expansion = len(self.get_expansion_moves(expandNode))
         return expandNode
 
-        
+    def allowed_children(self, node):
+        "the number of children node may have, max_num_expansion unless progressive widening limits it"
+        if not self.pw_c:
+            return node.max_num_expansion
+        widened = max(1, int(self.pw_c * self.get_stats(node)[0] ** self.pw_alpha))
+        return min(widened, node.max_num_expansion)
+
+    def set_priors(self, node):
+        "give the children of node without one their prior from expansion_order"
+        if all(child.prior is not None for child in node.children):
+            return
+        priors = self.expansion_order(node)
+        for child in node.children:
+            child.prior = priors.get(child.move, 0.0)
+
+    def prior_move(self, node):
+        "the move of the highest prior node has not expanded yet, None if there is none"
+        expanded = set(child.move for child in node.children)
+        for move in self.expansion_order(node):
+            if move not in expanded:
+                return move
+        return None
+
+    def expansion_order(self, node):
+        """
+        the moves around node's path mapped to their prior for the player to move, highest first, ties in
+        random order; cached in priors by position hash, with symmetric by the canonical hash and with
+        the moves of the canonical position, mapped to node's by transform
+        """
+        path = []
+        _node = node
+        while _node.move:
+            path.append(_node)
+            _node = _node.parent
+        if self.symmetric:
+            key, k = self.canonical_position_hash(node)
+        else:
+            key, k = node.hash, 0
+        order = self.priors.get(key)
+        if order is not None:
+            self.priors.move_to_end(key)
+            if not self.symmetric:
+                return order
+            order = dict((transform(move, INVERSE_SYMMETRY[k]), prior) for move, prior in order.items())
+            # the root candidates do not turn with the position, so an image of it may have other moves around
+            if set(order) == set(self.get_moves_around([_node.move for _node in path])):
+                return order
+        board = self.MCTSboard
+        for _node in reversed(path):
+            board.update(_node.player, _node.move)
+        moves = list(self.get_moves_around([_node.move for _node in path]))
+        weights = self.prior(board, node.opponent, moves)
+        for _ in path:
+            board.undo()
+        total = float(sum(weights))
+        scored = sorted(((weight / total if total else 1.0 / len(moves), random.random(), move)
+                         for weight, move in zip(weights, moves)), reverse=True)
+        order = dict((move, prior) for prior, tie, move in scored)
+        self.priors[key] = dict((transform(move, k), prior) for move, prior in order.items()) if k else order
+        if len(self.priors) > self.prior_cache:
+            self.priors.popitem(last=False)
+        return order
+
+    def get_expansion_moves(self, node):
+        """
+        the moves node can still expand: the root candidates and the free cells around every
+        move on the path from the root, except the cells taken on the path and by node's children
+        """
+        path = []
+        _node = node
+        while _node.move:
+            path.append(_node.move)
+            _node = _node.parent
+        return self.get_moves_around(path, [child.move for child in node.children])
+
+    def get_moves_around(self, path, taken=()):
+        "the root candidates and the free cells around the moves of path, without path and taken"
+        board = self.MCTSboard.board
+        height, width = self.MCTSboard.height, self.MCTSboard.width
+        moves = MoveSet(self.candidates)
+        for x, y in path:
+            for i in range(max(x - 1, 0), min(x + 2, height)):
+                for j in range(max(y - 1, 0), min(y + 2, width)):
+                    if board[i][j] == 0:
+                        moves.add((i, j))
+        for move in path:
+            moves.discard(move)
+        for move in taken:
+            moves.discard(move)
+        return moves
+
     def simulate_and_bp(self, cur_board, expandNode):
+        "the path and the rollout are played on cur_board and taken back before returning"
+        depth = len(cur_board.history)
+        _node = expandNode
+
+        while _node.parent.move:
+            _node = _node.parent
+            cur_board.update(_node.player, _node.move)
+
+        if len(cur_board.neighbors) == 0:
+            cur_board.rewind(depth)
+            return
+
+        if expandNode.sim_num == 0 and not expandNode.proven:
+            self.prove(cur_board, expandNode)
+        if expandNode.proven:
+            cur_board.rewind(depth)
+            self.back_propagate(expandNode, 1 if expandNode.proven > 0 else 0)
+            self.propagate_proof(expandNode)
+            return
+
+        played = [] if self.rave_k else None
+        win, player = self.rollout(cur_board, expandNode.player, expandNode.move, played)
+        result = self.rollout_result(cur_board, expandNode.player, win, player)
+        cur_board.rewind(depth)
+        self.back_propagate(expandNode, result)
+        if played is not None:
+            # credited as back_propagate does, so the AMAF rates compare with the win rates they are blended with
+            self.update_amaf(expandNode, played, result)
+
+    def simulate_batch_and_bp(self, cur_board, expandNode, k):
+        "simulate_and_bp with k rollouts played at once by batch_rollout"
+        depth = len(cur_board.history)
         _node = expandNode
 
         while _node.parent.move:
             _node = _node.parent
-            cur_board.update(_node.player, _node.move, update_neighbor=False)
+            cur_board.update(_node.player, _node.move)
 
         if len(cur_board.neighbors) == 0:
+            cur_board.rewind(depth)
+            return
+
+        if expandNode.sim_num == 0 and not expandNode.proven:
+            self.prove(cur_board, expandNode)
+        if expandNode.proven:
+            cur_board.rewind(depth)
+            self.back_propagate(expandNode, k if expandNode.proven > 0 else 0, k)
+            self.propagate_proof(expandNode)
             return
 
-        cur_board.neighbors = cur_board.getNeighbors()
-        player = expandNode.player
-        win = cur_board.check_win(player, expandNode.move)
-        cur_board.update(player, expandNode.move)
-        for t in range(1, self.max_simulation_one_play + 1):
+        wins = self.batch_rollout(cur_board, expandNode.player, expandNode.move, k)
+        cur_board.rewind(depth)
+        self.back_propagate(expandNode, wins, k)
+
+    def propagate_proof(self, node):
+        """
+        MCTS-Solver: a move with a winning reply loses, a move whose replies, all expanded, all lose wins.
+        The proof of node goes up as far as it holds, a root proven -1 is won by the side to move.
+        Losses are proven among the moves get_expansion_moves allows only, wins are proven outright
+        """
+        while node.proven and node.parent is not None:
+            parent = node.parent
+            if node.proven > 0:
+                parent.proven = -1
+            elif (len(parent.children) >= parent.max_num_expansion
+                  and all(child.proven < 0 for child in parent.children)):
+                parent.proven = 1
+            else:
+                break
+            node = parent
+
+    def rollout_result(self, cur_board, leaf_player, win, player):
+        """
+        the win credited to leaf_player for a rollout that ended on cur_board, player made its last move:
+        1 for a five of leaf_player, else, with rollout_depth, evaluate's chance for leaf_player
+        """
+        if win:
+            return 1 if player == leaf_player else 0
+        if self.rollout_depth and len(cur_board.neighbors):
+            chance = self.evaluate(cur_board, self.get_player[player])
+            return chance if player != leaf_player else 1 - chance
+        return 0
+
+    def update_amaf(self, expandNode, played, result):
+        """
+        RAVE: along the path up from expandNode, credit each child whose move its player played later
+        in the simulation, played is the rollout's (player, move) list, result what back_propagate
+        counted for expandNode.player, a fraction with rollout_depth
+        """
+        later = {1: set(), 2: set()}
+        for player, move in played:
+            later[player].add(move)
+        node = expandNode
+        while node.parent is not None:
+            later[node.player].add(node.move)
+            node = node.parent
+            for child in node.children:
+                if child.move in later[child.player]:
+                    child.amaf_sim += 1
+                    if child.player == expandNode.player:
+                        child.amaf_win += result
+
+    def back_propagate(self, expandNode, wins, sims=1):
+        "count sims simulations from expandNode up to the root, wins of them won by expandNode.player"
+        currentNode = expandNode
+        while currentNode:
+            currentNode.sim_num += sims
+            credit = wins if currentNode.player == expandNode.player else 0
+            currentNode.win_num += credit
+            if self.tt is not None:
+                self.tt.add(currentNode, credit, sims)
+            currentNode = currentNode.parent
+
+    def rollout(self, cur_board, player, move, played=None):
+        """
+        play move for player and then random neighbor moves on cur_board, without taking them back,
+        at most rollout_depth of them if it is set, else max_simulation_one_play
+        :param played: a list to append the (player, move) of every move to, for RAVE
+        :return: (win, player), win is 1 if player made the last move and won by it
+        """
+        win = cur_board.check_win(player, move)
+        cur_board.update(player, move)
+        if played is not None:
+            played.append((player, move))
+        for t in range(1, (self.rollout_depth or self.max_simulation_one_play) + 1):
             is_full = not len(cur_board.neighbors)
             if win or is_full:
                 break
             player = self.get_player[player]
-            move = random.choice(list(cur_board.neighbors))
+            move = self.policy_move(cur_board, player) if self.rollout_policy else cur_board.neighbors.choice()
             win = cur_board.check_win(player, move)
             cur_board.update(player, move)
+            if played is not None:
+                played.append((player, move))
+        return win, player
 
-        currentNode = expandNode
-        while currentNode:
-            currentNode.sim_num += 1
-            if win and player == currentNode.player == expandNode.player:
-                currentNode.win_num += 1
-            currentNode = currentNode.parent
+    def evaluate(self, cur_board, player):
+        """
+        the static chance that player, who is to move, wins on cur_board: 1 with a five to play, 0 against
+        two fives of the opponent, else a logistic of the pattern weights of the neighbors summed per player
+        """
+        cur_board.sync_codes()
+        weights = cur_board.weights
+        width = cur_board.width
+        opponent = self.get_player[player]
+        own_five, other_five = ROLLOUT_FIVE[player], ROLLOUT_FIVE[opponent]
+        own_shift, other_shift = ROLLOUT_SHIFT[player], ROLLOUT_SHIFT[opponent]
+        own = other = 0
+        fives = 0
+        for move in cur_board.neighbors:
+            packed = weights[move[0] * width + move[1]]
+            if packed & own_five:
+                return 1.0
+            if packed & other_five:
+                fives += 1
+            own += packed >> own_shift & 0xfff
+            other += packed >> other_shift & 0xfff
+        if fives > 1:
+            return 0.0
+        return 1 / (1 + np.exp(EVALUATION_BIAS - (EVALUATION_TEMPO * own - other) / EVALUATION_SCALE))
+
+    def policy_move(self, cur_board, player):
+        """
+        the rollout move of player: a five if there is one, else the block of the opponent's five, else
+        a neighbor drawn with weight 1 + 2 * its pattern weight for player + its pattern weight for the opponent
+        """
+        cur_board.sync_codes()
+        weights = cur_board.weights
+        width = cur_board.width
+        opponent = self.get_player[player]
+        own_five, other_five = ROLLOUT_FIVE[player], ROLLOUT_FIVE[opponent]
+        own_shift, other_shift = ROLLOUT_SHIFT[player], ROLLOUT_SHIFT[opponent]
+        moves = cur_board.neighbors.moves
+        scores = []
+        block = None
+        for move in moves:
+            packed = weights[move[0] * width + move[1]]
+            if packed & own_five:
+                return move
+            if packed & other_five:
+                block = move
+            scores.append(1 + 2 * (packed >> own_shift & 0xfff) + (packed >> other_shift & 0xfff))
+        if block is not None:
+            return block
+        return random.choices(moves, scores)[0]
+
+    def batch_rollout(self, cur_board, player, move, k):
+        """
+        k rollouts in lockstep on a (k, 15, 15) array: player takes move in all of them, then every game
+        still going takes a random neighbor move, as rollout does, until five in a row, no neighbor left
+        or max_simulation_one_play moves. cur_board is not changed.
+        :return: the number of games player wins
+        """
+        if cur_board.check_win(player, move):
+            return k
+        first = player
+        if self.rng is None:
+            self.rng = numpy.random.default_rng(random.getrandbits(64))
+        # a border wide enough for the neighbor offsets and the lines of check_win,
+        # with no stone and no neighbor on it
+        n = self.n_in_line - 1
+        pad = max(n, 2)
+        size = MAX_BOARD + 2 * pad
+        inside = numpy.zeros((size, size), dtype=bool)
+        inside[pad:-pad, pad:-pad] = True
+        inside = inside.ravel()
+        around = numpy.array([dx * size + dy for dx, dy in cur_board.NEIGHBOR_OFFSETS])
+        lines = [numpy.arange(-n, n + 1) * (dx * size + dy) for dx, dy in LINE_DIRECTIONS]
+
+        start = numpy.zeros((size, size), dtype=numpy.int8)
+        start[pad:-pad, pad:-pad] = cur_board.board
+        neighbors = numpy.zeros((size, size), dtype=bool)
+        if len(cur_board.availables) < cur_board.width * cur_board.height:
+            for x, y in cur_board.neighbors:
+                neighbors[pad + x, pad + y] = True
+        boards = numpy.repeat(start.reshape(1, -1), k, axis=0)
+        candidates = numpy.repeat(neighbors.reshape(1, -1), k, axis=0)
+        games = numpy.arange(k)
+        picks = numpy.full(k, (pad + move[0]) * size + pad + move[1])
+        winner = numpy.zeros(k, dtype=numpy.int8)
+        for t in range(self.max_simulation_one_play + 1):
+            if t:
+                player = self.get_player[player]
+                # a uniform random candidate of every game, the one with the largest key
+                keys = self.rng.random((len(games), size * size))
+                keys[~candidates[games]] = -1
+                picks = keys.argmax(axis=1)
+                going = candidates[games, picks]
+                games, picks = games[going], picks[going]
+                if not len(games):
+                    break
+            boards[games, picks] = player
+            candidates[games, picks] = False
+            cells = picks[:, None] + around
+            candidates[games[:, None], cells] |= (boards[games[:, None], cells] == 0) & inside[cells]
+            if t:
+                # five in a row through the move, as a window of n_in_line stones summing to n_in_line
+                won = numpy.zeros(len(games), dtype=bool)
+                for line in lines:
+                    stones = (boards[games[:, None], picks[:, None] + line] == player).astype(numpy.int8)
+                    windows = numpy.lib.stride_tricks.sliding_window_view(stones, self.n_in_line, axis=1)
+                    won |= (windows.sum(axis=2) == self.n_in_line).any(axis=1)
+                winner[games[won]] = player
+                games, picks = games[~won], picks[~won]
+        return int((winner == first).sum())
+
+    def search_shared_tree(self, tree, lock, time_limit):
+        """
+        tree parallelization: search the SharedTree together with the other processes holding it.
+        Selection adds a virtual loss to every node it passes, so concurrent searchers spread out,
+        back propagation takes it back with the real result. A leaf whose move makes five is marked
+        terminal and counts a win on every visit, without a rollout.
+        """
+        cur_board = self.MCTSboard
+        width = cur_board.width
+        timer = TimeManager(time_limit)
+        while not timer.expired():
+            with lock:
+                path = tree.select(self.virtual_loss)
+                leaf = path[-1]
+                if tree.first_child[leaf] < 0 and not tree.terminal[leaf] and (leaf == 0 or tree.visits[leaf] > 0):
+                    moves = self.get_moves_around([divmod(int(tree.move[i]), width) for i in path[1:]])
+                    if tree.expand(leaf, [x * width + y for x, y in moves]):
+                        leaf = tree.first_child[leaf] + random.randrange(tree.num_children[leaf])
+                        tree.virtual[leaf] += self.virtual_loss
+                        path.append(leaf)
+            depth = len(cur_board.history)
+            result = 0
+            terminal = tree.terminal[leaf]
+            if terminal:
+                result = 1
+            elif len(path) > 1:
+                for i in path[1:-1]:
+                    cur_board.update(int(tree.player[i]), divmod(int(tree.move[i]), width))
+                leaf_player, leaf_move = int(tree.player[leaf]), divmod(int(tree.move[leaf]), width)
+                if cur_board.check_win(leaf_player, leaf_move):
+                    terminal = result = 1
+                else:
+                    win, player = self.rollout(cur_board, leaf_player, leaf_move)
+                    result = self.rollout_result(cur_board, leaf_player, win, player)
+                cur_board.rewind(depth)
+            with lock:
+                tree.terminal[leaf] = terminal
+                for i in path:
+                    tree.visits[i] += 1
+                    tree.virtual[i] -= self.virtual_loss
+                    if result and tree.player[i] == tree.player[leaf]:
+                        tree.wins[i] += result
+
+    def search_tree_parallel(self, time_limit):
+        """
+        tree parallelization: the worker processes search one SharedTree from the current board,
+        then the statistics of its root children are added to our root children. The workers get all
+        our options, but the SharedTree keeps visits and wins only, so its selection is UCB1 with
+        virtual loss, without the transposition table, RAVE, widening or PUCT, and rollouts go one by one
+        """
+        tree = SharedTree(self.shared_nodes)
+        lock = multiprocessing.Lock()
+        seed = self.seed if self.seed is not None else random.randrange(1 << 30)
+        kwargs = dict(self.worker_kwargs(), virtual_loss=self.virtual_loss)
+        workers = [
+            multiprocessing.Process(target=shared_tree_worker,
+                                    args=(tree.shm.name, self.shared_nodes, lock,
+                                          self.MCTSboard.board, kwargs, seed + i, time_limit))
+            for i in range(self.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        first, num_children = tree.first_child[0], tree.num_children[0]
+        stats = []
+        for i in range(first, first + num_children if first >= 0 else first):
+            stats.append((divmod(int(tree.move[i]), self.MCTSboard.width), int(tree.visits[i]), float(tree.wins[i])))
+        tree.close()
+        tree.shm.unlink()
+        self.merge_root_stats(stats)
  
 
+class TranspositionTable:
+    """
+    [sim_num, win_num] per Zobrist hash, shared by the tree nodes of the same position.
+    It holds at most capacity positions and evicts the least recently used one.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, position_hash):
+        return self.entries.get(position_hash)
+
+    def add(self, node, win, sims=1):
+        """
+        count sims simulations through node's position, win of them won;
+        a position new to the table starts from node's own statistics, which already hold it
+        """
+        entry = self.entries.get(node.hash)
+        if entry is None:
+            self.entries[node.hash] = [node.sim_num, node.win_num]
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            return
+        self.entries.move_to_end(node.hash)
+        entry[0] += sims
+        entry[1] += win
+
+
+class TimeManager:
+    """
+    the search time of one move on the monotonic clock, read once every check_every calls of expired.
+    The budget is time_limit, or with clock, the seconds left for the game, at most an even share of
+    clock over the moves likely left; the opening gets opening_share of it. Without adaptive the search
+    runs the whole budget. With adaptive it stops at budget / extension, or sooner once the leader is safe,
+    and goes on up to the budget while the top two root children are close.
+    """
+
+    def __init__(self, time_limit, stones=0, clock=None, adaptive=False, check_every=8, extension=1.5,
+                 safe_margin=3.0, close_margin=1.0, min_sims=100, opening_stones=6, opening_share=0.5,
+                 game_stones=80, min_moves_left=10):
+        self.begin = time.monotonic()
+        budget = time_limit
+        if clock is not None:
+            # our moves left, if the game runs to about game_stones stones
+            moves_left = max((game_stones - stones) // 2, min_moves_left)
+            budget = min(budget, clock / moves_left * extension)
+        if adaptive and stones < opening_stones:
+            budget *= opening_share
+        self.hard = budget
+        self.soft = budget / extension if adaptive else budget
+        self.adaptive = adaptive
+        self.check_every = check_every
+        # the leader is safe when it leads the runner-up by safe_margin standard errors of their win rates,
+        # close when by less than close_margin
+        self.safe_margin = safe_margin
+        self.close_margin = close_margin
+        self.min_sims = min_sims
+        self.calls = 0
+        self.stopped = False
+
+    def elapsed(self):
+        return time.monotonic() - self.begin
+
+    def left(self):
+        "the seconds left of the soft limit, all the search time there is without adaptive"
+        return max(self.soft - self.elapsed(), 0.0)
+
+    def expired(self, root=None, get_stats=None):
+        """
+        True once the search of root should stop, and from then on;
+        get_stats gives (sim_num, win_num) of a node, adaptive needs both
+        """
+        if self.stopped:
+            return True
+        self.calls += 1
+        if self.calls % self.check_every:
+            return False
+        elapsed = self.elapsed()
+        if elapsed >= self.hard:
+            self.stopped = True
+        elif self.adaptive:
+            gap = self.leader_gap(root, get_stats)
+            if elapsed >= self.soft:
+                self.stopped = gap is None or gap >= self.close_margin
+            else:
+                self.stopped = gap is not None and gap >= self.safe_margin
+        return self.stopped
+
+    def leader_gap(self, root, get_stats):
+        """
+        how many standard errors the win rate of the best root child is above the second's, get_action plays
+        the best win rate; infinite when a single child is not proven, None when none is
+        """
+        if len(root.children) < root.max_num_expansion:
+            # some candidate has not been tried yet
+            return 0.0
+        rates = []
+        for child in root.children:
+            if child.proven:
+                continue
+            sim_num, win_num = get_stats(child)
+            if sim_num:
+                rates.append((win_num / sim_num, sim_num))
+        if len(rates) < 2:
+            return float('inf') if rates else None
+        rates.sort(reverse=True)
+        (rate1, sims1), (rate2, sims2) = rates[0], rates[1]
+        if min(sims1, sims2) < self.min_sims:
+            return 0.0
+        error = np.sqrt(rate1 * (1 - rate1) / sims1 + rate2 * (1 - rate2) / sims2)
+        if error == 0:
+            return 0.0 if rate1 == rate2 else float('inf')
+        return (rate1 - rate2) / error
+
+
+class ThreatSolver:
+    """
+    threat-space search on a Board: the attacker only plays fours (VCF, victory by continuous fours) or,
+    with vct, open threes too (victory by continuous threes), so the defender has few replies to try:
+    the five a four threatens, or for a three the cells of its line and the defender's own fours.
+    A win found is proven, not finding one proves nothing. The depth goes up one threat at a time to
+    max_depth, so a short win is not missed in a long line searched first; a search stops after
+    max_nodes positions or time_limit seconds, the board is back where it was when solve returns.
+    """
+
+    def __init__(self, board, max_nodes=10000, time_limit=1.0, max_depth=12):
+        self.board = board
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        # the attacker plays at most this many threats
+        self.max_depth = max_depth
+        self.nodes = 0
+        self.deadline = 0
+        # set once the budget is spent, every search level then gives up
+        self.stopped = False
+
+    def solve(self, player, vct=True):
+        "a move winning for player, who is to move, by continuous threats; None if none is found"
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = time.monotonic() + self.time_limit
+        for depth in range(1, self.max_depth + 1):
+            move = self.attack(player, vct, depth)
+            if move is not None or self.stopped:
+                return move
+        return None
+
+    def out_of_budget(self):
+        self.nodes += 1
+        if self.nodes > self.max_nodes or (self.nodes % 64 == 0 and time.monotonic() > self.deadline):
+            self.stopped = True
+        return self.stopped
+
+    def five_moves(self, player):
+        "the free cells where player makes five"
+        board = self.board
+        board.sync_codes()
+        codes = board.codes
+        five = FIVE_CODES[player]
+        moves = []
+        for move in board.neighbors:
+            index = (move[0] * board.width + move[1]) * 4
+            if five[codes[index]] or five[codes[index + 1]] or five[codes[index + 2]] or five[codes[index + 3]]:
+                moves.append(move)
+        return moves
+
+    def threats(self, player, moves, vct):
+        """
+        the moves of player making a four, then those making a three when vct,
+        as (move, directions of the three); the moves threatening in more directions come first
+        """
+        fours = []
+        threes = []
+        for move in moves:
+            codes = self.board.line_codes(player, move)
+            num_fours = sum(1 for code in codes if FIVE_STEPS[code])
+            directions = [d for d, code in enumerate(codes) if OPEN_FOUR_STEPS[code]]
+            if num_fours:
+                fours.append((num_fours, len(directions), move))
+            elif vct and directions:
+                threes.append((len(directions), move, directions))
+        fours.sort(key=lambda four: four[:2], reverse=True)
+        threes.sort(key=lambda three: three[0], reverse=True)
+        return [(move, ()) for _, _, move in fours] + [(move, directions) for _, move, directions in threes]
+
+    def attack(self, player, vct, depth):
+        "a threat of player to move that wins, None if none is found"
+        if self.out_of_budget():
+            return None
+        board = self.board
+        opponent = 3 - player
+        fives = self.five_moves(player)
+        if fives:
+            return fives[0]
+        if depth == 0:
+            return None
+        blocks = self.five_moves(opponent)
+        if len(blocks) > 1:
+            return None
+        # a five of the opponent has to be blocked, which only helps if the block is a threat itself
+        threats = self.threats(player, blocks or list(board.neighbors), vct)
+        for move, directions in threats:
+            if directions:
+                break
+            # an open four or a double four leaves two fives, one block cannot stop both
+            board.update(player, move)
+            won = len(self.five_moves(player)) > 1
+            board.undo()
+            if won:
+                return move
+        for move, directions in threats:
+            board.update(player, move)
+            won = self.defend(opponent, move, directions, vct, depth - 1)
+            board.undo()
+            if won:
+                return move
+            if self.stopped:
+                return None
+        return None
+
+    def defend(self, player, threat, directions, vct, depth):
+        "True if every reply of player to the threat just played loses to a further threat"
+        if self.out_of_budget():
+            return False
+        board = self.board
+        attacker = 3 - player
+        if self.five_moves(player):
+            return False
+        fives = self.five_moves(attacker)
+        if len(fives) > 1:
+            return True
+        if fives:
+            replies = fives
+        else:
+            # a three: either block on its line or counter with a four, anything else meets an open four
+            replies = set(move for move, _ in self.threats(player, board.neighbors, False))
+            x, y = threat
+            for d in directions:
+                dx, dy = LINE_DIRECTIONS[d]
+                for step in LINE_STEPS:
+                    i, j = x + step * dx, y + step * dy
+                    if 0 <= i < board.height and 0 <= j < board.width and board.board[i][j] == 0:
+                        replies.add((i, j))
+        for move in replies:
+            board.update(player, move)
+            won = self.attack(attacker, vct, depth)
+            board.undo()
+            if won is None:
+                return False
+        return True
+
+
+class SharedTree:
+    """
+    a search tree in one multiprocessing.shared_memory block, so several processes can search it at once.
+    Nodes are indexes into the arrays below, the children of a node take the index range
+    first_child[node] .. first_child[node] + num_children[node], and node 0 is the root.
+    terminal[node] is 1 once node's move is found to make five, such a node is never expanded.
+    """
+    FIELDS = (
+        ('visits', 'f8'), ('wins', 'f8'),
+        ('virtual', 'i4'), ('first_child', 'i4'), ('num_children', 'i4'),
+        ('move', 'i2'), ('player', 'i1'), ('terminal', 'i1'),
+    )
+
+    def __init__(self, capacity, name=None):
+        """
+        :param capacity: the number of nodes the block holds
+        :param name: attach to the block of that name, a new block is created if None
+        """
+        self.capacity = capacity
+        size = 8 + sum(numpy.dtype(dtype).itemsize for _, dtype in self.FIELDS) * capacity
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        # used[0] is the number of nodes taken
+        self.used = numpy.ndarray((1,), dtype='i8', buffer=self.shm.buf)
+        offset = 8
+        for field, dtype in self.FIELDS:
+            array = numpy.ndarray((capacity,), dtype=dtype, buffer=self.shm.buf, offset=offset)
+            setattr(self, field, array)
+            offset += array.nbytes
+        if name is None:
+            self.used[0] = 1
+            self.visits[0] = self.wins[0] = self.virtual[0] = 0
+            self.first_child[0] = -1
+            self.num_children[0] = 0
+            self.move[0] = -1
+            self.player[0] = 1
+            self.terminal[0] = 0
+
+    def select(self, virtual_loss):
+        """
+        walk down by UCB, counting each visit in progress as a lost simulation,
+        and add virtual_loss to the nodes passed; call it holding the lock
+        :return: the indexes from the root to the selected node
+        """
+        node = 0
+        self.virtual[0] += virtual_loss
+        path = [0]
+        while self.first_child[node] >= 0:
+            first = self.first_child[node]
+            last = first + self.num_children[node]
+            visits = self.visits[first:last] + self.virtual[first:last]
+            total = self.visits[node] + self.virtual[node]
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                ucb = numpy.where(visits > 0,
+                                  self.wins[first:last] / visits + numpy.sqrt(2 * np.log(max(total, 1)) / visits),
+                                  numpy.inf)
+            node = first + int(numpy.argmax(ucb))
+            self.virtual[node] += virtual_loss
+            path.append(node)
+        return path
+
+    def expand(self, node, moves):
+        """
+        give node one child per encoded move in a new index range; call it holding the lock
+        :return: 1 if node has children now, 0 if there was no move or no room left
+        """
+        first = int(self.used[0])
+        if not moves or first + len(moves) > self.capacity:
+            return 0
+        last = first + len(moves)
+        self.used[0] = last
+        self.visits[first:last] = 0
+        self.wins[first:last] = 0
+        self.virtual[first:last] = 0
+        self.first_child[first:last] = -1
+        self.num_children[first:last] = 0
+        self.move[first:last] = moves
+        self.player[first:last] = 3 - self.player[node]
+        self.terminal[first:last] = 0
+        self.num_children[node] = len(moves)
+        self.first_child[node] = first
+        return 1
+
+    def close(self):
+        for field, _ in self.FIELDS:
+            delattr(self, field)
+        del self.used
+        self.shm.close()
+
+
+def shared_tree_worker(name, capacity, lock, input_board, kwargs, seed, time_limit):
+    "run by the processes of MCTS.search_tree_parallel"
+    random.seed(seed)
+    tree = SharedTree(capacity, name)
+    worker = MCTS(input_board, **kwargs)
+    worker.search_shared_tree(tree, lock, time_limit)
+    tree.close()
+
+
+def search_worker(job):
+    "run by the processes of MCTS.search_parallel, returns (move, sim_num, win_num) of the root children"
+    input_board, kwargs, seed, time_limit = job
+    random.seed(seed)
+    worker = MCTS(input_board, **kwargs)
+    worker.search(time_limit)
+    return [(child.move, child.sim_num, child.win_num) for child in worker.root.children]
+
+
 def isFree(x, y):
     return 0 <= x < MAX_BOARD and 0 <= y < MAX_BOARD and board[x][y] == 0
 
 
 if __name__ == "__main__":
 
+    MCTS_ARGS = dict(n_in_line=5,
+                     time_limit=5.4,
+                     max_simulation=150,
+                     max_simulation_one_play=120,
+                     bitboard=True,
+                     tt_size=200000,
+                     threat_nodes=5000,
+                     rollout_policy=True)
+    MCTS_AI = None
     full_input = json.loads(input())
     all_requests = full_input["requests"]
     all_responses = full_input["responses"]
     if(all_requests[0]["x"] == -1 and len(all_responses) == 0):
+        x, y = 7, 7
         my_action = { "x": int(7), "y": 7 }
         print(json.dumps({
             "response": my_action,
@@ -733,18 +2172,50 @@ if __name__ == "__main__":
             oppY = int(all_requests[i]["y"])
             board[oppX][oppY] = 1 
        
-        MCTS_AI = MCTS(board,
-                    n_in_line=5,
-                    time_limit=5.4,
-                    max_simulation=150,  
-                    max_simulation_one_play=120)
+        MCTS_AI = MCTS(board, **MCTS_ARGS)
+        if TREE_REUSE and full_input.get("data") and len(all_responses):
+            MCTS_AI.load_tree(full_input["data"],
+                              (int(all_responses[-1]["x"]), int(all_responses[-1]["y"])), (oppX, oppY))
+        while True:
+            move = MCTS_AI.get_action()
+            x, y = move
+            if isFree(x, y):
+                break
+        my_action = { "x": int(x), "y": y }
+        print(json.dumps({
+            "response": my_action,
+            "data": MCTS_AI.dump_tree(move) if TREE_REUSE and not KEEP_RUNNING else None
+        }))
+    board[x][y] = 2
+
+    # from now on Botzone only sends this turn's request, the board and the tree stay in memory
+    while KEEP_RUNNING:
+        print(">>>BOTZONE_REQUEST_KEEP_RUNNING<<<")
+        sys.stdout.flush()
+        if PONDER and MCTS_AI is not None:
+            MCTS_AI.start_pondering((x, y))
+        try:
+            request = json.loads(input())
+        except EOFError:
+            break
+        if "requests" in request:
+            request = request["requests"][-1]
+        oppX, oppY = int(request["x"]), int(request["y"])
+        board[oppX][oppY] = 1
+        if MCTS_AI is None:
+            MCTS_AI = MCTS(board, **MCTS_ARGS)
+        elif MCTS_AI.ponder_thread is not None:
+            MCTS_AI.stop_pondering((oppX, oppY))
+        else:
+            MCTS_AI.advance((x, y), (oppX, oppY))
         while True:
             move = MCTS_AI.get_action()
             x, y = move
             if isFree(x, y):
                 break
+        board[x][y] = 2
         my_action = { "x": int(x), "y": y }
         print(json.dumps({
             "response": my_action,
             "data": None
-        }))
\ No newline at end of file
+        }))
@@ -24,66 +24,77 @@ MAX_BOARD = args.board_size
 board = [[0 for i in range(MAX_BOARD)] for j in range(MAX_BOARD)]
 
 
-class Node:
+class MoveSet:
+    """
+    a set of moves that also keeps them in a list, so a random move is drawn in O(1),
+    removing a move swaps the last one into its slot
+    """
+    __slots__ = ('moves', 'index')
+
+    def __init__(self, moves=()):
+        self.moves = []
+        self.index = {}
+        for move in moves:
+            self.add(move)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def __contains__(self, move):
+        return move in self.index
+
+    def add(self, move):
+        if move not in self.index:
+            self.index[move] = len(self.moves)
+            self.moves.append(move)
+
+    def discard(self, move):
+        i = self.index.pop(move, None)
+        if i is None:
+            return
+        last = self.moves.pop()
+        if i < len(self.moves):
+            self.moves[i] = last
+            self.index[last] = i
+
+    def remove(self, move):
+        if move not in self.index:
+            raise KeyError(move)
+        self.discard(move)
+
+    def clear(self):
+        self.moves = []
+        self.index = {}
+
+    def choice(self):
+        return random.choice(self.moves)
+
 
-    def __init__(self, move, UCB=0, parent=None,
-                 num_child=-1, possible_moves_for_child=None, possible_moves_for_expansion=None,
-                 board_width=None, board_height=None, num_expand=None):
+class Node:
+    """
+    a tree node only keeps its move and statistics, the moves it can still expand are
+    derived from the path by MCTS.get_expansion_moves, so no node carries a copy of the move sets
+    """
+    __slots__ = ('move', 'parent', 'children', 'sim_num', 'win_num', 'proven',
+                 'player', 'opponent', 'max_num_expansion')
+
+    def __init__(self, move, parent=None, num_expand=0):
         self.move = move
-        self.UCB = UCB  # not used yet
         self.parent = parent
         self.children = []
         self.sim_num = 0
         self.win_num = 0
-        self.winner = 0
-        if parent is None:
-            self.max_num_child = num_child
-            self.max_num_expansion = num_expand
-            self.board_width = board_width
-            self.board_height = board_height
-            # inherit the possible moves for this node's children, similar to board.availables
-            # so not used yet
-            self.possible_moves_for_child = copy.deepcopy(possible_moves_for_child)
-
-            self.possible_moves_for_expansion = copy.deepcopy(possible_moves_for_expansion)
-
+        # 1 if move is proven to win for player, -1 if it is proven to lose, 0 while unknown
+        self.proven = 0
+        # number of moves this node may expand, children count against it
+        self.max_num_expansion = num_expand
         if parent is not None:
-            if parent.max_num_child > 0:
-                self.max_num_child = parent.max_num_child - 1
-            # avoid expanding a move twice
-            parent.possible_moves_for_expansion.remove(move)
-
-            # independently inherit
-            self.possible_moves_for_child = copy.deepcopy(parent.possible_moves_for_child)
-            self.possible_moves_for_child.remove(move)
-            # update the neighbor information
-            self.possible_moves_for_expansion = copy.deepcopy(parent.possible_moves_for_expansion)
-            self.board_width = parent.board_width
-            self.board_height = parent.board_height
-            x, y = move
-            up, down, left, right = x, self.board_height - 1 - x, y, self.board_width - 1 - y
-            if up:
-                self.possible_moves_for_expansion.add((x - 1, y))
-                if left:
-                    self.possible_moves_for_expansion.add((x - 1, y - 1))
-                if right:
-                    self.possible_moves_for_expansion.add((x - 1, y + 1))
-            if down:
-                self.possible_moves_for_expansion.add((x + 1, y))
-                if left:
-                    self.possible_moves_for_expansion.add((x + 1, y - 1))
-                if right:
-                    self.possible_moves_for_expansion.add((x + 1, y + 1))
-            if left:
-                self.possible_moves_for_expansion.add((x, y - 1))
-            if right:
-                self.possible_moves_for_expansion.add((x, y + 1))
-            self.possible_moves_for_expansion = self.possible_moves_for_expansion & self.possible_moves_for_child
-            self.max_num_expansion = len(self.possible_moves_for_expansion)
             self.opponent = parent.player
             self.player = parent.opponent
             parent.children.append(self)
-            self.winner = parent.winner
         else:
             "zs: note that here is reverse because root is used to be your opponent's turn!!!"
             self.player = 1
@@ -91,6 +102,8 @@ class Node:
 
 
 class Board:
+    # a free cell is a neighbor, i.e. a candidate move, while any stone is at one of these offsets
+    NEIGHBOR_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
 
     def __init__(self, input_board, n_in_line=5):
         assert type(n_in_line) == int, "n_in_line para should be INT!"
@@ -101,73 +114,81 @@ class Board:
         self.availables = set([
             (i, j) for i in range(self.height) for j in range(self.width) if input_board[i][j] == 0
         ])
+        # counts[x][y] is the number of stones having (x, y) in their neighborhood,
+        # update and undo keep it and the neighbors set in step
+        self.around = [[self.get_around(i, j) for j in range(self.width)] for i in range(self.height)]
+        self.counts = [[0 for j in range(self.width)] for i in range(self.height)]
+        for i in range(self.height):
+            for j in range(self.width):
+                if self.board[i][j]:
+                    for x, y in self.around[i][j]:
+                        self.counts[x][y] += 1
         self.neighbors = self.get_neighbors()
         self.winner = None
+        # stack of the moves played by update(), used by undo()
+        self.history = []
 
     def is_free(self, x, y):
         return 1 if self.board[x][y] == 0 else 0
 
+    def get_around(self, x, y):
+        return [
+            (x + dx, y + dy) for dx, dy in self.NEIGHBOR_OFFSETS
+            if 0 <= x + dx < self.height and 0 <= y + dy < self.width
+        ]
+
     def get_neighbors(self):
-        neighbors = set()
         if len(self.availables) == self.width * self.height:
             "if the board is empty, then choose from the center one"
             "assume our board is bigger than 1x1"
             x0, y0 = self.width // 2 - 1, self.height // 2 - 1
-            neighbors.add((x0, y0))
-            return neighbors
-        else:
-            for i in range(self.height):
-                for j in range(self.width):
-                    if self.board[i][j]:
-                        neighbors.add((i - 1, j - 1))
-                        neighbors.add((i - 1, j))
-                        neighbors.add((i - 1, j + 1))
-                        neighbors.add((i, j - 1))
-                        neighbors.add((i, j + 1))
-                        neighbors.add((i + 1, j - 1))
-                        neighbors.add((i + 1, j))
-                        neighbors.add((i + 1, j + 1))
-
-            return neighbors & self.availables
-
-    def update(self, player, move, update_neighbor=True):
+            return MoveSet([(x0, y0)])
+        return MoveSet([move for move in self.availables if self.counts[move[0]][move[1]]])
+
+    def update(self, player, move):
         """
-        update the board and check if player wins, so one should use like this:
-            if board.update(player, move):
-                winner = board.winner
+        update the board, the neighbors follow incrementally through the reference counts
         :param player: the one to take the move
         :param move: a tuple (x, y)
-        :param update_neighbor: built for periods when you are sure no one wins
-        :return: 1 denotes player wins and 0 denotes not
         """
         assert len(move) == 2, "move is invalid, length = {}".format(len(move))
-        self.board[move[0]][move[1]] = player
+        x, y = move
+        if len(self.availables) == self.width * self.height:
+            # drop the center cell given to the empty board
+            self.neighbors.clear()
+        self.board[x][y] = player
         self.availables.remove(move)
-
-        if update_neighbor:
-            self.neighbors.remove(move)
-
-            neighbors = set()
-            x, y = move
-            up, down, left, right = x, self.height - 1 - x, y, self.width - 1 - y
-            if up:
-                neighbors.add((x - 1, y))
-                if left:
-                    neighbors.add((x - 1, y - 1))
-                if right:
-                    neighbors.add((x - 1, y + 1))
-            if down:
-                neighbors.add((x + 1, y))
-                if left:
-                    neighbors.add((x + 1, y - 1))
-                if right:
-                    neighbors.add((x + 1, y + 1))
-            if left:
-                neighbors.add((x, y - 1))
-            if right:
-                neighbors.add((x, y + 1))
-            neighbors = self.availables & neighbors
-            self.neighbors = self.neighbors | neighbors
+        self.neighbors.discard(move)
+        for i, j in self.around[x][y]:
+            self.counts[i][j] += 1
+            if self.counts[i][j] == 1 and self.board[i][j] == 0:
+                self.neighbors.add((i, j))
+        self.history.append(move)
+
+    def undo(self):
+        """
+        take back the last update, so one working board can be replayed forward and then rewound:
+            board.update(player, move)
+            ...
+            board.undo()
+        """
+        move = self.history.pop()
+        x, y = move
+        self.board[x][y] = 0
+        self.availables.add(move)
+        for i, j in self.around[x][y]:
+            self.counts[i][j] -= 1
+            if self.counts[i][j] == 0 and self.board[i][j] == 0:
+                self.neighbors.discard((i, j))
+        if self.counts[x][y]:
+            self.neighbors.add(move)
+        elif len(self.availables) == self.width * self.height:
+            self.neighbors = self.get_neighbors()
+
+    def rewind(self, depth):
+        """undo moves until only the first depth moves of history are left"""
+        while len(self.history) > depth:
+            self.undo()
 
     def check_win(self, player, move):
         """check if player win, this function will not actually do the move"""
@@ -224,52 +245,123 @@ class Board:
         return 0
 
 
+class BitBoard(Board):
+    """
+    the same board with one int per row, column and diagonal for each player,
+    so check_win finds n in line with shifts and masks instead of scanning every window
+    """
+
+    def __init__(self, input_board, n_in_line=5):
+        Board.__init__(self, input_board, n_in_line)
+        n_diagonal = self.width + self.height - 1
+        # lines[player] = [rows, columns, diagonals \, anti-diagonals /], the bit of a cell
+        # is its column in a row and its row otherwise
+        self.lines = {
+            player: [[0] * self.height, [0] * self.width, [0] * n_diagonal, [0] * n_diagonal]
+            for player in (1, 2)
+        }
+        # win_masks[bit] covers the starts of the n in line windows holding that bit
+        self.win_masks = []
+        for bit in range(max(self.width, self.height)):
+            low = max(bit - self.n_in_line + 1, 0)
+            self.win_masks.append(((1 << (bit + 1)) - 1) ^ ((1 << low) - 1))
+        for i in range(self.height):
+            for j in range(self.width):
+                if self.board[i][j]:
+                    self.flip(self.board[i][j], i, j)
+
+    def flip(self, player, x, y):
+        rows, columns, diagonals, anti_diagonals = self.lines[player]
+        rows[x] ^= 1 << y
+        columns[y] ^= 1 << x
+        diagonals[x - y + self.width - 1] ^= 1 << x
+        anti_diagonals[x + y] ^= 1 << x
+
+    def update(self, player, move):
+        Board.update(self, player, move)
+        self.flip(player, move[0], move[1])
+
+    def undo(self):
+        x, y = self.history[-1]
+        self.flip(self.board[x][y], x, y)
+        Board.undo(self)
+
+    def check_win(self, player, move):
+        """check if player win, this function will not actually do the move"""
+        x, y = move
+        rows, columns, diagonals, anti_diagonals = self.lines[player]
+        for line, bit in ((rows[x], y), (columns[y], x),
+                          (diagonals[x - y + self.width - 1], x), (anti_diagonals[x + y], x)):
+            line |= 1 << bit
+            # bit i of run is set when the n cells from i on are all taken
+            run = line
+            for shift in range(1, self.n_in_line):
+                run &= line >> shift
+            if run & self.win_masks[bit]:
+                return 1
+        return 0
+
+
 class MCTS:
 
     def __init__(self, input_board, n_in_line=5,
-                 confidence=2.0, time_limit=5.0, max_simulation=5, max_simulation_one_play=50):
+                 confidence=2.0, time_limit=5.0, max_simulation=5, max_simulation_one_play=50, bitboard=False,
+                 check_every=8):
         self.time_limit = float(time_limit)
+        # get_action reads the monotonic clock once every check_every nodes and simulations
+        self.check_every = check_every
         self.max_simulation = max_simulation
         self.max_simulation_one_play = max_simulation_one_play
-        self.MCTSboard = Board(input_board, n_in_line)     # a deep copy Board class object
+        # a deep copy Board class object, BitBoard gives the same results with a faster check_win
+        self.MCTSboard = BitBoard(input_board, n_in_line) if bitboard else Board(input_board, n_in_line)
         self.confidence = confidence                       # confidence level of exploration
         self.player = 2
         self.get_player = {
             1: 2,
             2: 1,
         }
-        self.root = Node(None,
-                         parent=None,
-                         num_child=len(self.MCTSboard.availables),
-                         possible_moves_for_child=self.MCTSboard.availables,
-                         possible_moves_for_expansion=self.MCTSboard.neighbors,
-                         num_expand=len(self.MCTSboard.neighbors),
-                         board_width=self.MCTSboard.width,
-                         board_height=self.MCTSboard.height)
+        # the moves the root expands, deeper nodes add the cells around their path
+        self.candidates = set(self.MCTSboard.neighbors)
+        self.root = Node(None, parent=None, num_expand=len(self.candidates))
 
     def get_action(self):
         if len(self.MCTSboard.availables) == 1:
             return list(self.MCTSboard.availables)[0]  # the only choice
+        move = self.forced_move()
+        if move is not None:
+            return move
 
         num_nodes = 0
-        begin_time = time.time()
-        while time.time() - begin_time < self.time_limit:
+        deadline = time.monotonic() + self.time_limit
+        ticks = 0
+        out_of_time = False
+        # stop early once the root is solved
+        while not out_of_time and not self.root.proven:
+            ticks += 1
+            if ticks % self.check_every == 0 and time.monotonic() >= deadline:
+                break
             # Selection & Expansion
             node_to_expand = self.select_and_expand()
+            if node_to_expand is None:
+                continue
 
             # Simulation & back propagation
             for _ in range(self.max_simulation):
-                board_deep_copy = copy.deepcopy(self.MCTSboard)
-                self.simulate_and_bp(board_deep_copy, node_to_expand)
+                ticks += 1
+                if ticks % self.check_every == 0 and time.monotonic() >= deadline:
+                    out_of_time = True
+                if out_of_time or node_to_expand.proven:
+                    break
+                self.simulate_and_bp(self.MCTSboard, node_to_expand)
 
             num_nodes += 1
         if args.detail:
             print("total nodes expanded in one action:{}".format(num_nodes))
 
-        percent_wins, move = max(
-            (child.win_num / child.sim_num + child.winner, child.move)
+        proven, percent_wins, move = max(
+            (child.proven, child.win_num / child.sim_num, child.move)
             for child in self.root.children
-        )  # choose a move with highest winning rate
+        )  # choose a proven win, else a move with highest winning rate, a proven loss last
         if args.detail:
             for child in self.root.children:
                 if child.win_num / child.sim_num > 0.4:
@@ -279,6 +371,16 @@ class MCTS:
 
         return move
 
+    def forced_move(self):
+        "the only candidate, our five, or else the block of the opponent's five, None if there is none of them"
+        if len(self.candidates) == 1:
+            return next(iter(self.candidates))
+        for player in (self.root.opponent, self.root.player):
+            for move in self.candidates:
+                if self.MCTSboard.check_win(player, move):
+                    return move
+        return None
+
     def select_and_expand(self):
         "Selection: greedy search based on UCB value"
         cur_node = self.root
@@ -289,36 +391,81 @@ class MCTS:
 
             ucb, select_node = 0, None
             for child in cur_node.children:
-
+                # a proven subtree has nothing left to search
+                if child.proven:
+                    continue
                 ucb_child = child.win_num / child.sim_num + np.sqrt(
                     2 * np.log(cur_node.sim_num) / child.sim_num
                 )
                 if ucb_child >= ucb:
                     ucb, select_node = ucb_child, child
+            if select_node is None:
+                return None
             cur_node = select_node
 
         "Expansion: randomly expand a node"
-        expand_move = random.choice(list(cur_node.possible_moves_for_expansion))
+        expand_move = self.get_expansion_moves(cur_node).choice()
         expand_node = Node(expand_move, parent=cur_node)
+        expand_node.max_num_expansion = len(self.get_expansion_moves(expand_node))
         return expand_node
 
+    def get_expansion_moves(self, node):
+        """
+        the moves node can still expand: the root candidates and the free cells around every
+        move on the path from the root, except the cells taken on the path and by node's children
+        """
+        board = self.MCTSboard.board
+        height, width = self.MCTSboard.height, self.MCTSboard.width
+        moves = MoveSet(self.candidates)
+        taken = [child.move for child in node.children]
+        _node = node
+        while _node.move:
+            x, y = _node.move
+            taken.append(_node.move)
+            for i in range(max(x - 1, 0), min(x + 2, height)):
+                for j in range(max(y - 1, 0), min(y + 2, width)):
+                    if board[i][j] == 0:
+                        moves.add((i, j))
+            _node = _node.parent
+        for move in taken:
+            moves.discard(move)
+        return moves
+
+    def propagate_proof(self, node):
+        """
+        MCTS-Solver: a move with a winning reply loses, a move whose replies, all expanded, all lose wins.
+        The proof of node goes up as far as it holds, a root proven -1 is won by the side to move
+        """
+        while node.proven and node.parent is not None:
+            parent = node.parent
+            if node.proven > 0:
+                parent.proven = -1
+            elif (len(parent.children) >= parent.max_num_expansion
+                  and all(child.proven < 0 for child in parent.children)):
+                parent.proven = 1
+            else:
+                break
+            node = parent
+
     def simulate_and_bp(self, cur_board, expand_node):
-        # first get to the board now
+        # first get to the board now, every move is taken back before returning
+        depth = len(cur_board.history)
         _node = expand_node
 
         while _node.parent.move:
             _node = _node.parent
-            cur_board.update(_node.player, _node.move, update_neighbor=False)
+            cur_board.update(_node.player, _node.move)
 
         "Simulation: do simulation randomly & neighborly"
         if len(cur_board.neighbors) == 0:
+            cur_board.rewind(depth)
             return
 
-        cur_board.neighbors = cur_board.get_neighbors()
         player = expand_node.player
         win = cur_board.check_win(player, expand_node.move)
         if win:
-            expand_node.winner = player
+            expand_node.proven = 1
+            self.propagate_proof(expand_node)
         cur_board.update(player, expand_node.move)
 
         for t in range(1, self.max_simulation_one_play + 1):
@@ -327,9 +474,10 @@ class MCTS:
                 break
 
             player = self.get_player[player]
-            move = random.choice(list(cur_board.neighbors))
+            move = cur_board.neighbors.choice()
             win = cur_board.check_win(player, move)
             cur_board.update(player, move)
+        cur_board.rewind(depth)
 
         "Back propagation"
         cur_node = expand_node
@@ -381,7 +529,8 @@ if __name__ == "__main__":
                     n_in_line=5,
                     time_limit=5.6,
                     max_simulation=50,  
-                    max_simulation_one_play=120)
+                    max_simulation_one_play=120,
+                    bitboard=True)
         while True:
             move = MCTS_AI.get_action()
             x, y = move